@@ -0,0 +1,146 @@
+import time
+
+import django
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=["django_cotton"],
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "DIRS": ["example_project/templates"],
+            "OPTIONS": {
+                "loaders": ["django_cotton.cotton_loader.Loader"],
+                "builtins": ["django_cotton.templatetags.cotton"],
+            },
+        },
+    ],
+)
+
+django.setup()
+
+from django.template import Engine, Template  # noqa: E402
+
+from django_cotton.bs4_compiler import CottonCompiler  # noqa: E402
+from django_cotton.nodelist_cache import (  # noqa: E402
+    PreparsedTemplate,
+    dump_nodelist,
+    load_nodelist,
+)
+from django_cotton.tokenizer_compiler import TokenizerCompiler  # noqa: E402
+
+ROW = """
+<tr class="row {{ row_class }}">
+    <td>{{ item.name }}</td>
+    <td>
+        <c-button :disabled="item.disabled" label="{% trans "Go" %}" class="btn btn-primary">
+            <c-slot name="icon"><c-icon name="arrow" /></c-slot>
+            Open {{ item.id }}
+        </c-button>
+    </td>
+</tr>
+"""
+
+
+def make_template(rows):
+    return "<c-vars title />\n<table>{% for item in items %}" + ROW * rows + "{% endfor %}</table>"
+
+
+FIELD = """
+<label for="{{ field.id_for_label }}" class="{% if field.errors %}error{% endif %}">{{ field.label }}</label>
+<input name="{{ field.html_name }}" value="{{ field.value|default:"" }}" {% if field.field.required %}required{% endif %}>
+"""
+
+
+def make_form_template(fields):
+    return "<c-form>{% csrf_token %}" + FIELD * fields + "</c-form>"
+
+
+def make_nested_template(depth, components):
+    """`components` components, arranged in stacks that are each `depth` levels deep."""
+    stack = "content"
+    for level in range(depth):
+        stack = f'<c-level{level} class="l{level}"><c-slot name="title">{level}</c-slot>{stack}</c-level{level}>'
+    return "<div>" + stack * (components // depth) + "</div>"
+
+
+def compile_bench(compiler, template, iterations):
+    start_time = time.time()
+    for _ in range(iterations):
+        compiler.process(template, "benchmark")
+    end_time = time.time()
+    return end_time - start_time
+
+
+for rows, iterations in ((1, 200), (20, 20), (200, 2)):
+    template = make_template(rows)
+    time_bs4 = compile_bench(CottonCompiler(), template, iterations)
+    time_tokenizer = compile_bench(TokenizerCompiler(), template, iterations)
+    kb = len(template) * iterations / 1024
+
+    print(f"{rows} rows ({len(template)} chars) x {iterations}:")
+    print(f"  bs4 compiler: {time_bs4:.4f} seconds ({kb / time_bs4:.0f} KB/s)")
+    print(f"  tokenizer compiler: {time_tokenizer:.4f} seconds ({kb / time_tokenizer:.0f} KB/s)")
+    print(f"  speedup: {time_bs4 / time_tokenizer:.1f}x")
+
+
+# Compile time should grow with the number of components, not with how deeply they are nested
+for depth, components in ((1, 2000), (10, 500), (10, 1000), (10, 2000)):
+    template = make_nested_template(depth, components)
+    time_bs4 = compile_bench(CottonCompiler(), template, 1)
+    time_tokenizer = compile_bench(TokenizerCompiler(), template, 1)
+
+    print(f"{components} components, {depth} levels deep ({len(template)} chars):")
+    print(
+        f"  bs4 compiler: {time_bs4:.4f} seconds ({time_bs4 / components * 1e6:.0f} us/component)"
+    )
+    print(
+        f"  tokenizer compiler: {time_tokenizer:.4f} seconds "
+        f"({time_tokenizer / components * 1e6:.0f} us/component)"
+    )
+
+
+# Restoring django syntax should take a single scan, however many expressions the template contains
+for fields in (100, 500, 1000):
+    template = make_form_template(fields)
+    time_bs4 = compile_bench(CottonCompiler(), template, 1)
+    time_tokenizer = compile_bench(TokenizerCompiler(), template, 1)
+
+    print(f"form with {fields * 8} expressions ({len(template)} chars):")
+    print(f"  bs4 compiler: {time_bs4:.4f} seconds")
+    print(f"  tokenizer compiler: {time_tokenizer:.4f} seconds")
+
+
+def parse_bench(compiled, iterations):
+    engine = Engine.get_default()
+    start_time = time.time()
+    for _ in range(iterations):
+        Template(compiled, engine=engine)
+    return time.time() - start_time
+
+
+def preparsed_bench(compiled, iterations):
+    engine = Engine.get_default()
+    template = Template(compiled, engine=engine)
+    data = dump_nodelist(template)
+    start_time = time.time()
+    for _ in range(iterations):
+        nodelist = load_nodelist(data, template.origin, engine)
+        PreparsedTemplate(compiled, template.origin, None, engine, nodelist)
+    return time.time() - start_time, len(data)
+
+
+# Building the largest pages from a cached nodelist (COTTON_NODELIST_CACHE_ENABLED) rather than parsing them
+for label, template in (
+    ("200 rows", make_template(200)),
+    ("2000 components, 10 levels deep", make_nested_template(10, 2000)),
+    ("form with 8000 expressions", make_form_template(1000)),
+):
+    compiled = "{% load i18n %}" + TokenizerCompiler().process(template, "benchmark")
+    time_parse = parse_bench(compiled, 10)
+    time_preparsed, size = preparsed_bench(compiled, 10)
+
+    print(f"{label} ({len(compiled)} chars compiled, {size} bytes pickled) x 10:")
+    print(f"  parse: {time_parse:.4f} seconds")
+    print(f"  cached nodelist: {time_preparsed:.4f} seconds")
+    print(f"  speedup: {time_parse / time_preparsed:.1f}x")
@@ -0,0 +1,76 @@
+"""Renders a component 100,000 times in a loop, to measure the cost of building its attrs on each render, with only
+static attributes and with a dynamic one added."""
+
+import os
+import tempfile
+import time
+
+import django
+from django.conf import settings
+
+TEMPLATES_DIR = tempfile.mkdtemp()
+
+settings.configure(
+    INSTALLED_APPS=["django_cotton"],
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "DIRS": [TEMPLATES_DIR],
+            "OPTIONS": {
+                "loaders": [
+                    "django_cotton.cotton_loader.Loader",
+                    "django.template.loaders.filesystem.Loader",
+                ],
+                "builtins": ["django_cotton.templatetags.cotton"],
+            },
+        },
+    ],
+    DEBUG=False,
+)
+
+django.setup()
+
+from django.template import Context  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+
+RENDERS = 100_000
+
+COMPONENT = """<svg {{ attrs }}><use href="#{{ name }}"></use></svg>"""
+
+TEMPLATES = {
+    "static": """{% for item in items %}<c-icon name="check" class="w-4 h-4" aria-hidden="true" />{% endfor %}""",
+    "dynamic": """{% for item in items %}<c-icon name="check" class="w-4 h-4" aria-hidden="true" :data-id="item" />"""
+    """{% endfor %}""",
+}
+
+
+def write_template(name, content):
+    path = os.path.join(TEMPLATES_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def render_bench(template_name, iterations):
+    template = get_template(template_name).template
+    timings = []
+
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        template.render(Context({"items": range(RENDERS)}))
+        timings.append(time.perf_counter() - start_time)
+
+    return min(timings)
+
+
+write_template("cotton/icon.html", COMPONENT)
+
+for name, content in TEMPLATES.items():
+    write_template(f"{name}.html", content)
+
+for name in TEMPLATES:
+    seconds = render_bench(f"{name}.html", 5)
+    print(
+        f"{RENDERS:,} renders, {name} attributes: {seconds * 1000:.0f}ms "
+        f"({seconds / RENDERS * 1e6:.2f}µs each)"
+    )
@@ -0,0 +1,80 @@
+"""Renders a table of 1,000 rows with four components each, under a context carrying as much data as a typical set of
+context processors, to measure the cost of handing the context to each component."""
+
+import os
+import tempfile
+import time
+
+import django
+from django.conf import settings
+
+TEMPLATES_DIR = tempfile.mkdtemp()
+
+settings.configure(
+    INSTALLED_APPS=["django_cotton"],
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "DIRS": [TEMPLATES_DIR],
+            "OPTIONS": {
+                "loaders": [
+                    "django_cotton.cotton_loader.Loader",
+                    "django.template.loaders.filesystem.Loader",
+                ],
+                "builtins": ["django_cotton.templatetags.cotton"],
+            },
+        },
+    ],
+    DEBUG=False,
+)
+
+django.setup()
+
+from django.template import Context  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+
+COMPONENTS = {
+    "badge": '<c-vars tone="grey" /><span class="badge {{ tone }}">{{ slot }}</span>',
+    "link": '<a href="{{ href }}" {{ attrs }}>{{ slot }}</a>',
+    "cell": "<td {{ attrs }}>{{ slot }}</td>",
+}
+
+ROW = """{% for item in items %}<tr>
+<c-cell{only} class="name"><c-link{only} href="/items/{{ item }}/">Item {{ item }}</c-link></c-cell>
+<c-cell{only}><c-badge{only} tone="green">{{ item }}</c-badge></c-cell>
+</tr>{% endfor %}"""
+
+
+def write_template(name, content):
+    path = os.path.join(TEMPLATES_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def render_bench(template_name, context_size, iterations):
+    template = get_template(template_name).template
+    # Stands in for the data context processors add, i.e. user, perms, messages, csrf_token, request
+    context_data = {f"processor_value_{i}": i for i in range(context_size)}
+    context_data["items"] = range(1000)
+
+    timings = []
+
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        template.render(Context(context_data))
+        timings.append(time.perf_counter() - start_time)
+
+    return min(timings)
+
+
+for name, content in COMPONENTS.items():
+    write_template(f"cotton/{name}.html", content)
+
+write_template("table.html", "<table>" + ROW.replace("{only}", "") + "</table>")
+write_template("table_only.html", "<table>" + ROW.replace("{only}", " c-only") + "</table>")
+
+for context_size in (10, 100, 500):
+    print(f"1,000 rows x 4 components, {context_size} context variables:")
+    print(f"  shared context: {render_bench('table.html', context_size, 10) * 1000:.1f}ms")
+    print(f"  only: {render_bench('table_only.html', context_size, 10) * 1000:.1f}ms")
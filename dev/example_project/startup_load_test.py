@@ -0,0 +1,111 @@
+"""Measures the startup time and memory (on linux) of a worker that serves only precompiled templates, so never needs
+bs4. "eager" imports bs4 up front, as the loader used to on import, to compare against."""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+START_TIME = time.perf_counter()
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+TEMPLATES = ["cotton/benchmarks/cotton.html", "cotton/benchmarks/cotton_include.html"]
+RUNS = 5
+
+
+def configure(build_dir):
+    settings.configure(
+        INSTALLED_APPS=["django_cotton"],
+        TEMPLATES=[
+            {
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "DIRS": ["example_project/templates"],
+                "OPTIONS": {
+                    "loaders": [
+                        "django_cotton.cotton_loader.Loader",
+                        "django.template.loaders.filesystem.Loader",
+                    ],
+                    "builtins": ["django_cotton.templatetags.cotton"],
+                },
+            },
+        ],
+        COTTON_BUILD_DIR=build_dir,
+        COTTON_SERVE_FROM_BUILD=True,
+        DEBUG=False,
+    )
+    django.setup()
+
+
+def get_rss():
+    """Resident memory in bytes. ru_maxrss would include the parent's memory, as it survives the exec."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def worker(mode, build_dir):
+    if mode == "eager":
+        import bs4  # noqa: F401
+
+    configure(build_dir)
+
+    from django.template.loader import render_to_string
+
+    for template_name in TEMPLATES:
+        render_to_string(template_name)
+
+    print(
+        json.dumps(
+            {
+                "seconds": time.perf_counter() - START_TIME,
+                "rss": get_rss(),
+                "bs4_loaded": "bs4" in sys.modules,
+            }
+        )
+    )
+
+
+def run_workers(mode, build_dir):
+    results = []
+
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", mode, build_dir],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output))
+
+    return (
+        statistics.median(result["seconds"] for result in results),
+        statistics.median(result["rss"] for result in results),
+        results[0]["bs4_loaded"],
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as build_dir:
+        configure(build_dir)
+
+        from django_cotton.build import compile_templates
+
+        compile_templates(build_dir)
+
+        for mode in ("lazy", "eager"):
+            seconds, rss, bs4_loaded = run_workers(mode, build_dir)
+            print(
+                f"{mode:>5}: {seconds * 1000:.1f}ms to first render, {rss / 2**20:.1f}MB RSS, "
+                f"bs4 loaded: {bs4_loaded}"
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(*sys.argv[2:4])
+    else:
+        main()
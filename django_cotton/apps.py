@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class CottonConfig(AppConfig):
+    name = "django_cotton"
+
+    def ready(self):
+        if getattr(settings, "COTTON_WARM_UP", False):
+            from django_cotton.warm_up import is_server_process, warm_up
+
+            if is_server_process():
+                warm_up()
@@ -0,0 +1,263 @@
+import re
+import warnings
+
+from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning, NavigableString, Tag
+from bs4.formatter import HTMLFormatter
+from django.conf import settings
+
+warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
+
+
+class UnsortedAttributes(HTMLFormatter):
+    """This keeps BS4 from re-ordering attributes"""
+
+    def attributes(self, tag):
+        for k, v in tag.attrs.items():
+            yield k, v
+
+
+class CottonCompiler:
+    DJANGO_SYNTAX_PLACEHOLDER_PREFIX = "__django_syntax__"
+    COTTON_VERBATIM_PATTERN = re.compile(
+        r"\{% cotton_verbatim %\}(.*?)\{% endcotton_verbatim %\}", re.DOTALL
+    )
+    DJANGO_TAG_PATTERN = re.compile(r"(\s?)(\{%.*?%\})(\s?)")
+    DJANGO_VAR_PATTERN = re.compile(r"(\s?)(\{\{.*?\}\})(\s?)")
+    PLACEHOLDER_PATTERN = re.compile(
+        rf"(\s*){DJANGO_SYNTAX_PLACEHOLDER_PREFIX}(\d+)__(\s*)(?:(?={DJANGO_SYNTAX_PLACEHOLDER_PREFIX}(\d+)__))?"
+    )
+    DUPLICATE_ATTRIBUTE_MARKER_PATTERN = re.compile(
+        r"__COTTON_DUPE_ATTR__[0-9A-F]{5}", re.IGNORECASE
+    )
+
+    def process(self, content, template_name):
+        """Compile a template. All state is local to the call, so a compiler can be shared between threads."""
+        content, placeholders = self._replace_syntax_with_placeholders(content)
+        content = self._compile_cotton_to_django(content, template_name)
+        content = self._fix_bs4_attribute_empty_attribute_behaviour(content)
+        content = self._replace_placeholders_with_syntax(content, placeholders)
+        content = self._remove_duplicate_attribute_markers(content)
+
+        return content
+
+    def _replace_syntax_with_placeholders(self, content):
+        """Replace {% ... %} and {{ ... }} with placeholders so they dont get touched
+        or encoded by bs4. We will replace them back after bs4 has done its job. Returns the content along with the
+        placeholders' original syntax."""
+        placeholders = []
+
+        def replace_pattern(pattern, replacement_func):
+            return pattern.sub(replacement_func, content)
+
+        def replace_cotton_verbatim(match):
+            """{% cotton_verbatim %} protects the content through the bs4 parsing process when we want to actually print
+            cotton syntax in <pre> blocks."""
+            inner_content = match.group(1)
+            placeholders.append({"type": "verbatim", "content": inner_content})
+            return f"{self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX}{len(placeholders)}__"
+
+        def replace_django_syntax(match):
+            """Store if the match had at least one space on the left or right side of the syntax so we can restore it later"""
+            left_space, syntax, right_space = match.groups()
+            placeholders.append(
+                {
+                    "type": "django",
+                    "content": syntax,
+                    "left_space": bool(left_space),
+                    "right_space": bool(right_space),
+                }
+            )
+            return f" {self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX}{len(placeholders)}__ "
+
+        # Replace cotton_verbatim blocks
+        content = replace_pattern(self.COTTON_VERBATIM_PATTERN, replace_cotton_verbatim)
+
+        # Replace {% ... %}
+        content = replace_pattern(self.DJANGO_TAG_PATTERN, replace_django_syntax)
+
+        # Replace {{ ... }}
+        content = replace_pattern(self.DJANGO_VAR_PATTERN, replace_django_syntax)
+
+        return content, placeholders
+
+    def _compile_cotton_to_django(self, html_content, template_name):
+        """Convert cotton <c-* syntax to {%."""
+        soup = BeautifulSoup(
+            html_content,
+            "html.parser",
+            on_duplicate_attribute=self.handle_duplicate_attributes,
+        )
+
+        # check if soup contains a 'c-vars' tag
+        if cvars_el := soup.find("c-vars"):
+            soup = self._wrap_with_cotton_vars_frame(soup, cvars_el)
+
+        self._transform_components(soup, template_name)
+
+        return str(soup.encode(formatter=UnsortedAttributes()).decode("utf-8"))
+
+    def _replace_placeholders_with_syntax(self, content, placeholders):
+        """Replace placeholders with original syntax, in a single scan of the content.
+
+        Whitespace around a placeholder is only kept on the sides where the original syntax had some. This is to avoid
+        unnecessary whitespace changes in the output that can lead to unintended tag type mutations,
+        i.e. <div{% expr %}></div> --> <div__placeholder></div__placeholder> --> <div{% expr %}></div{% expr %}>
+        """
+
+        def keeps_space(index, side):
+            placeholder = placeholders[int(index) - 1]
+            return placeholder["type"] == "verbatim" or placeholder[side]
+
+        def replace_placeholder(match):
+            left, index, right, next_index = match.groups()
+
+            if not keeps_space(index, "left_space"):
+                left = ""
+
+            # Whitespace between two placeholders is kept only if neither of them removes it
+            if not keeps_space(index, "right_space") or (
+                next_index and not keeps_space(next_index, "left_space")
+            ):
+                right = ""
+
+            return left + placeholders[int(index) - 1]["content"] + right
+
+        return self.PLACEHOLDER_PATTERN.sub(replace_placeholder, content)
+
+    def _remove_duplicate_attribute_markers(self, content):
+        return self.DUPLICATE_ATTRIBUTE_MARKER_PATTERN.sub("", content)
+
+    def _fix_bs4_attribute_empty_attribute_behaviour(self, contents):
+        """Bs4 adds ="" to valueless attribute-like parts in HTML tags that causes issues when we want to manipulate
+        django expressions."""
+        contents = contents.replace('=""', "")
+
+        return contents
+
+    def _wrap_with_cotton_vars_frame(self, soup, cvars_el):
+        """If the user has defined a <c-vars> tag, wrap content with {% cotton_vars_frame %} to be able to create and
+        govern vars and attributes. To be able to defined new vars within a component and also have them available in the
+        same component's context, we wrap the entire contents in another component: cotton_vars_frame. Only when <c-vars>
+        is present."""
+
+        vars_with_defaults = []
+        for var, value in cvars_el.attrs.items():
+            # Attributes in context at this point will already have been formatted in _component to be accessible, so in order to cascade match the style.
+            accessible_var = var.replace("-", "_")
+
+            if value is None:
+                vars_with_defaults.append(f"{var}={accessible_var}")
+            elif var.startswith(":"):
+                # If ':' is present, the user wants to parse a literal string as the default value,
+                # i.e. "['a', 'b']", "{'a': 'b'}", "True", "False", "None" or "1".
+                var = var[1:]  # Remove the ':' prefix
+                accessible_var = accessible_var[1:]  # Remove the ':' prefix
+                vars_with_defaults.append(f'{var}={accessible_var}|eval_default:"{value}"')
+            else:
+                # Assuming value is already a string that represents the default value
+                vars_with_defaults.append(f'{var}={accessible_var}|default:"{value}"')
+
+        cvars_el.decompose()
+
+        # Construct the {% with %} opening tag
+        opening = "{% cotton_vars_frame " + " ".join(vars_with_defaults) + " %}"
+        closing = "{% endcotton_vars_frame %}"
+
+        # Convert the remaining soup back to a string and wrap it within {% with %} block
+        wrapped_content = (
+            opening
+            + str(soup.encode(formatter=UnsortedAttributes()).decode("utf-8")).strip()
+            + closing
+        )
+
+        # Since we can't replace the soup object itself, we create new soup instead
+        new_soup = BeautifulSoup(
+            wrapped_content,
+            "html.parser",
+            on_duplicate_attribute=self.handle_duplicate_attributes,
+        )
+
+        return new_soup
+
+    def _transform_components(self, soup, parent_key):
+        """Replace <c-[component path]> tags with the {% cotton_component %} template tag. The tree is walked once and
+        rewritten in place, so nested components are compiled without re-parsing their contents."""
+        for tag in list(soup.children):
+            if not isinstance(tag, Tag):
+                continue
+
+            if tag.name == "c-slot":
+                self._transform_named_slot(tag, parent_key)
+            elif tag.name.startswith("c-"):
+                self._transform_component(tag)
+            else:
+                self._transform_components(tag, parent_key)
+
+        return soup
+
+    def _transform_component(self, tag):
+        """Compile <c-[component path]> to {% cotton_component %}"""
+        component_key = tag.name[2:]
+        component_path = component_key.replace(".", "/").replace("-", "_")
+        # c-only isolates the component from the context it's used in, rather than being one of its attributes
+        only = "only " if tag.attrs.pop("c-only", None) is not None else ""
+        opening_tag = f"{{% cotton_component {only}{'{}/{}.html'.format(settings.COTTON_DIR if hasattr(settings, 'COTTON_DIR') else 'cotton', component_path)} {component_key} "
+
+        # Store attributes that contain template expressions, they are when we use '{{' or '{%' in the value of an attribute
+        expression_attrs = []
+
+        # Build the attributes
+        for key, value in tag.attrs.items():
+            # BS4 stores class values as a list, so we need to join them back into a string
+            if key == "class":
+                value = " ".join(value)
+
+            # Django templates tags cannot have {{ or {% expressions in their attribute values
+            # Neither can they have new lines, let's treat them both as "expression attrs"
+            if self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX in value or "\n" in value or "=" in value:
+                expression_attrs.append((key, value))
+                continue
+
+            opening_tag += ' {}="{}"'.format(key, value)
+        opening_tag += " %}"
+
+        for key, value in expression_attrs:
+            opening_tag += f"{{% cotton_slot {key} {component_key} expression_attr %}}{value}{{% end_cotton_slot %}}"
+
+        self._transform_components(tag, component_key)
+        self._replace_tag_with_syntax(tag, opening_tag, "{% end_cotton_component %}")
+
+    def _transform_named_slot(self, slot_tag, component_key):
+        """Compile <c-slot> to {% cotton_slot %}"""
+        slot_name = slot_tag.get("name", "").strip()
+
+        # Check and process any components in the slot content
+        self._transform_components(slot_tag, component_key)
+        self._replace_tag_with_syntax(
+            slot_tag, f"{{% cotton_slot {slot_name} {component_key} %}}", "{% end_cotton_slot %}"
+        )
+
+    @staticmethod
+    def _replace_tag_with_syntax(tag, opening, closing):
+        """Swap the tag's own markup for the given template syntax, keeping its (already compiled) contents in place.
+        Hiding the tag rather than unwrapping it avoids bs4 looking up the tag's position among its
+        siblings."""
+        tag.hidden = True
+        tag.insert(0, NavigableString(opening))
+        tag.append(NavigableString(closing))
+
+    @staticmethod
+    def handle_duplicate_attributes(tag_attrs, key, value):
+        """BS4 cleans html and removes duplicate attributes. This would be fine if our target was html, but actually
+        we're targeting Django Template Language. This contains expressions to govern content including attributes of
+        any XML-like tag. It's perfectly fine to expect duplicate attributes per tag in DTL:
+
+        <a href="#" {% if something %} class="this" {% else %} class="that" {% endif %}>Hello</a>
+
+        The solution here is to make duplicate attribute keys unique across that tag so BS4 will not attempt to merge or
+        replace existing. Then in post processing we'll remove the unique mask. The mask is derived from the attribute's
+        position in the tag, so the same source always produces the same compiled output.
+        """
+        key_id = f"{len(tag_attrs):05X}"
+        key = f"{key}__COTTON_DUPE_ATTR__{key_id}"
+        tag_attrs[key] = value
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.template import Engine
+
+from django_cotton.cotton_loader import (
+    MANIFEST_FILENAME,
+    Loader,
+    cache_version,
+    get_compiled_hash,
+    is_cotton_template,
+)
+
+# The loader each worker process compiles with, see _setup_worker
+worker_loader = None
+
+
+class BuildResult:
+    """The outcome of compile_templates: the manifest that was written, the time spent compiling each template (in
+    seconds), the error message for each template that failed to compile and the names of the templates that were
+    unchanged since the last build and so skipped."""
+
+    def __init__(self, manifest, timings, errors, skipped):
+        self.manifest = manifest
+        self.timings = timings
+        self.errors = errors
+        self.skipped = skipped
+
+    @property
+    def compiled(self):
+        return list(self.timings)
+
+
+def get_build_settings():
+    """Everything besides the source that the compiled output depends on. A build made with different settings, or by an
+    older compiler, is recompiled from scratch."""
+    return {
+        "version": cache_version,
+        "compiler": getattr(settings, "COTTON_COMPILER", "bs4"),
+        "cotton_dir": getattr(settings, "COTTON_DIR", "cotton"),
+        "inline_components": getattr(settings, "COTTON_INLINE_COMPONENTS", False),
+        "inline_components_max_size": getattr(settings, "COTTON_INLINE_COMPONENTS_MAX_SIZE", 2048),
+    }
+
+
+def compile_templates(build_dir, loader=None, workers=1, force=False):
+    """Compile every cotton template the loader can find into build_dir, alongside a manifest recording each template's
+    source path (relative to its template dir, and which of the loader's dirs that is), source hash and compiled path.
+    Templates whose source hasn't changed since the last build into build_dir are skipped, unless force is set. With
+    more than one worker, templates are compiled across a process pool, each worker with a loader of its own using the
+    same dirs. Templates are compiled as the loader compiles them when they're loaded."""
+    if loader is None:
+        loader = Loader(Engine.get_default())
+
+    build_settings = get_build_settings()
+    previous_templates = {}
+
+    if not force:
+        previous_manifest = load_manifest(build_dir)
+        if previous_manifest and previous_manifest.get("settings") == build_settings:
+            previous_templates = previous_manifest["templates"]
+
+    os.makedirs(build_dir, exist_ok=True)
+    charset = loader.engine.file_charset
+    jobs = [
+        (
+            template_name,
+            path,
+            loader.get_template_dir_index(template_name, path),
+            build_dir,
+            charset,
+            previous_templates.get(template_name),
+        )
+        for template_name, path in loader.get_template_files()
+    ]
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_setup_worker, initargs=(loader.get_dirs(),)
+        ) as executor:
+            results = list(
+                executor.map(_compile_file, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+            )
+    else:
+        results = [_compile_file(job, loader) for job in jobs]
+
+    templates = {}
+    timings = {}
+    errors = {}
+    skipped = []
+
+    for template_name, entry, seconds, error in results:
+        if error is not None:
+            errors[template_name] = error
+        elif entry is None:
+            continue
+        elif seconds is None:
+            templates[template_name] = entry
+            skipped.append(template_name)
+        else:
+            templates[template_name] = entry
+            timings[template_name] = seconds
+
+    manifest = {"settings": build_settings, "templates": templates}
+
+    with open(os.path.join(build_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return BuildResult(manifest, timings, errors, skipped)
+
+
+def load_manifest(build_dir):
+    """Return the manifest of the last build into build_dir, or None if there hasn't been one."""
+    try:
+        with open(os.path.join(build_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _setup_worker(dirs):
+    """Workers that are spawned rather than forked start without django being set up."""
+    global worker_loader
+
+    if not apps.ready:
+        django.setup()
+
+    worker_loader = Loader(Engine.get_default(), dirs=list(dirs))
+
+
+def _compile_file(job, loader=None):
+    """Compile a single template into the build dir with the loader, or the worker's loader. Returns (template_name,
+    manifest entry, seconds, error), where the entry is None for templates without cotton syntax and seconds is None
+    when the previous build is still current. Templates with inlined components also record the components' compiled
+    hashes, as they are compiled again when one changes."""
+    template_name, path, dir_index, build_dir, charset, previous_entry = job
+    loader = loader or worker_loader
+    start_time = time.perf_counter()
+
+    try:
+        with open(path, "r", encoding=charset) as f:
+            template_string = f.read()
+    except UnicodeDecodeError:
+        return template_name, None, 0, None
+    except OSError as e:
+        # i.e. a broken symlink, or a file we aren't allowed to read
+        return template_name, None, 0, f"{type(e).__name__}: {e}"
+
+    if not is_cotton_template(template_string):
+        return template_name, None, 0, None
+
+    source_hash = hashlib.sha256(template_string.encode()).hexdigest()
+
+    if (
+        previous_entry is not None
+        and previous_entry.get("dir") == dir_index
+        and previous_entry["hash"] == source_hash
+        and os.path.exists(os.path.join(build_dir, previous_entry["compiled"]))
+        and not loader.has_changed_dependencies(previous_entry.get("dependencies", {}))
+    ):
+        return template_name, previous_entry, None, None
+
+    try:
+        compiled_template = loader.compile(template_string, template_name)
+
+        compiled_path = os.path.join(build_dir, template_name)
+        os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+        with open(compiled_path, "w", encoding=charset) as f:
+            f.write(compiled_template)
+    except Exception as e:
+        return template_name, None, 0, f"{type(e).__name__}: {e}"
+
+    entry = {
+        "source": template_name,
+        "dir": dir_index,
+        "hash": source_hash,
+        "compiled": template_name,
+        "compiled_hash": get_compiled_hash(compiled_template),
+    }
+    if dependencies := getattr(compiled_template, "dependencies", None):
+        entry["dependencies"] = dependencies
+
+    return template_name, entry, time.perf_counter() - start_time, None
@@ -1,27 +1,48 @@
-import warnings
 import hashlib
-import random
+import json
+import math
 import os
-import re
+import threading
+import time
+import zlib
+
+try:
+    import lzma
+except ImportError:  # Python can be built without lzma
+    lzma = None
 
 from django.template.loaders.base import Loader as BaseLoader
-from django.core.exceptions import SuspiciousFileOperation
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
 from django.template import TemplateDoesNotExist
-from bs4.formatter import HTMLFormatter
 from django.utils._os import safe_join
 from django.template import Template
 from django.core.cache import cache
 from django.template import Origin
+from django.utils.functional import cached_property
 from django.conf import settings
 from django.apps import apps
 
-from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
-
-warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
+from django_cotton.inlining import inline_components
+from django_cotton.lru_cache import LRUCache
+from django_cotton.stats import stats
+from django_cotton.tokenizer_compiler import TokenizerCompiler
 
 # If an update changes the API that a cached version of a template will break, we increment the cache version in order to
 # force the re-rendering of the template
-cache_version = "2"
+cache_version = "3"
+
+# Written by the cotton_compile management command into COTTON_BUILD_DIR
+MANIFEST_FILENAME = "manifest.json"
+
+# Compressed cache entries are stored as (COMPRESSION_ENVELOPE, COMPRESSION_ENVELOPE_VERSION, codec, data)
+COMPRESSION_ENVELOPE = "cotton_compressed"
+COMPRESSION_ENVELOPE_VERSION = 1
+# Templates with inlined components are stored as (INLINED_ENVELOPE, INLINED_ENVELOPE_VERSION, dependencies, content)
+INLINED_ENVELOPE = "cotton_inlined"
+INLINED_ENVELOPE_VERSION = 1
+COMPRESSION_CODECS = {"zlib": (zlib.compress, zlib.decompress)}
+if lzma is not None:
+    COMPRESSION_CODECS["lzma"] = (lzma.compress, lzma.decompress)
 
 
 class Loader(BaseLoader):
@@ -30,34 +51,281 @@ class Loader(BaseLoader):
     def __init__(self, engine, dirs=None):
         super().__init__(engine)
         self.cache_handler = CottonTemplateCacheHandler()
-        self.cotton_compiler = CottonCompiler()
+        self._cotton_compiler = None
         self.dirs = dirs
+        self.template_dirs = None
+        self.index_templates = getattr(settings, "COTTON_TEMPLATE_INDEX_ENABLED", False)
+        self.template_index = None
+        self.watcher_kind = getattr(settings, "COTTON_TEMPLATE_WATCHER", None)
+        self.watcher = None
+        self.watcher_lock = threading.Lock()
+        self.serve_from_build = getattr(settings, "COTTON_SERVE_FROM_BUILD", False)
+        self.serve_plain_templates = getattr(settings, "COTTON_SERVE_PLAIN_TEMPLATES", False)
+        self.manifest = None
+        self.cache_nodelists = getattr(settings, "COTTON_NODELIST_CACHE_ENABLED", False)
+        self.engine_key = None
+        self.inline_components = getattr(settings, "COTTON_INLINE_COMPONENTS", False)
+        # The components each thread is compiling to inline, so a component that uses itself isn't inlined forever
+        self.inlining = threading.local()
+        # mtimes of the templates found to contain no cotton syntax, by path, so we only read and scan them once
+        self.plain_templates = {}
+        # (mtime, template) of the components found to contain no cotton syntax, by path, for inlining
+        self.plain_components = {}
+
+    @property
+    def cotton_compiler(self):
+        if self._cotton_compiler is None:
+            self._cotton_compiler = get_compiler()
+
+        return self._cotton_compiler
+
+    def get_template(self, template_name, skip=None):
+        """With COTTON_NODELIST_CACHE_ENABLED, compiled templates are built from a nodelist parsed by whichever process
+        loaded them first, rather than being parsed again."""
+        if not self.cache_nodelists:
+            return super().get_template(template_name, skip)
+
+        from django_cotton.nodelist_cache import get_engine_key, get_template
+
+        tried = []
+
+        for origin in self.get_template_sources(template_name):
+            if skip is not None and origin in skip:
+                tried.append((origin, "Skipped to avoid recursion"))
+                continue
+
+            try:
+                contents = self.get_contents(origin)
+            except TemplateDoesNotExist:
+                tried.append((origin, "Source does not exist"))
+                continue
+
+            if getattr(origin, "compiled_hash", None) is None:
+                return Template(contents, origin, origin.template_name, self.engine)
+
+            if self.engine_key is None:
+                self.engine_key = get_engine_key(self.engine)
+
+            return get_template(contents, origin, self.engine, self.engine_key)
+
+        raise TemplateDoesNotExist(template_name, tried=tried)
 
     def get_contents(self, origin):
+        if self.serve_from_build:
+            compiled_template = self._get_built_contents(origin)
+            if compiled_template is not None:
+                return compiled_template
+
         # check if file exists, whilst getting the mtime for cache key
-        try:
-            mtime = os.path.getmtime(origin.name)
-        except FileNotFoundError:
-            raise TemplateDoesNotExist(origin)
+        mtime = self._get_mtime(origin)
+
+        if self.plain_templates.get(origin.name) == mtime:
+            return self._get_plain_contents(origin)
 
         cache_key = self.cache_handler.get_cache_key(origin.template_name, mtime)
         cached_content = self.cache_handler.get_cached_template(cache_key)
 
-        if cached_content is not None:
+        if cached_content is not None and not self.has_changed_dependencies(
+            cached_content.dependencies
+        ):
+            origin.compiled_hash = cached_content.compiled_hash
             return cached_content
 
         template_string = self._get_template_string(origin.name)
 
         # Do we need to process the template?
-        if "<c-" not in template_string and "{% cotton_verbatim" not in template_string:
+        if not is_cotton_template(template_string):
+            self.plain_templates[origin.name] = mtime
+            return self._get_plain_contents(origin, template_string)
+
+        if cached_content is None:
+            compiled_template = self.cache_handler.compile_once(
+                cache_key, lambda: self.compile(template_string, origin.template_name)
+            )
+        else:
+            # A component inlined into the cached template has changed since it was compiled
+            compiled_template = self.cache_handler.cache_template(
+                cache_key, self.compile(template_string, origin.template_name)
+            )
+
+        origin.compiled_hash = compiled_template.compiled_hash
+
+        return compiled_template
+
+    def compile(self, template_string, template_name):
+        if not stats.enabled:
+            return self._compile(template_string, template_name)
+
+        start_time = time.perf_counter()
+        compiled_template = self._compile(template_string, template_name)
+        stats.record_compile(
+            template_name, time.perf_counter() - start_time, template_string, compiled_template
+        )
+
+        return compiled_template
+
+    def _compile(self, template_string, template_name):
+        compiled_template = self.cotton_compiler.process(template_string, template_name)
+
+        if self.inline_components:
+            compiled_template, dependencies = inline_components(
+                compiled_template, self._get_inlinable_component
+            )
+            compiled_template = CompiledTemplate(compiled_template, dependencies)
+
+        return compiled_template
+
+    def _get_inlinable_component(self, template_name):
+        """The compiled template of a component for inline_components to inline, or None when we can't find it or are
+        already compiling it."""
+        if template_name in self.inlining.__dict__.setdefault("template_names", set()):
+            return None
+
+        return self._get_component(template_name)
+
+    def _get_component(self, template_name, check_dependencies=True):
+        """A component's compiled template, or its template as it is when it has no cotton syntax. Components are
+        compiled and cached as they would be when loaded, but without waiting on compile_once, as the component may be
+        waiting on the template we're compiling."""
+        compiling = self.inlining.__dict__.setdefault("template_names", set())
+
+        for origin in self.get_template_sources(template_name):
+            try:
+                mtime = self._get_mtime(origin)
+            except TemplateDoesNotExist:
+                continue
+
+            plain_mtime, plain_template = self.plain_components.get(origin.name, (None, None))
+            if plain_mtime == mtime:
+                return plain_template
+
+            cache_key = self.cache_handler.get_cache_key(template_name, mtime)
+            compiled_template = self.cache_handler.get_cached_template(cache_key)
+
+            if compiled_template is None or (
+                check_dependencies and self.has_changed_dependencies(compiled_template.dependencies)
+            ):
+                template_string = self._get_template_string(origin.name)
+
+                if not is_cotton_template(template_string):
+                    plain_template = CompiledTemplate(template_string)
+                    self.plain_components[origin.name] = (mtime, plain_template)
+                    return plain_template
+
+                compiling.add(template_name)
+                try:
+                    compiled_template = self._compile(template_string, template_name)
+                finally:
+                    compiling.discard(template_name)
+
+                compiled_template = self.cache_handler.cache_template(cache_key, compiled_template)
+
+            return compiled_template
+
+        return None
+
+    def has_changed_dependencies(self, dependencies):
+        """Whether any of the components inlined into a compiled template, given as its {template name: compiled hash}
+        dependencies, have changed (or gone) since. The components inlined into those are among them, so each only
+        needs comparing with how it's cached now, rather than checking its own dependencies too."""
+        for template_name, compiled_hash in dependencies.items():
+            component = self._get_component(template_name, check_dependencies=False)
+
+            if component is None or component.compiled_hash != compiled_hash:
+                return True
+
+        return False
+
+    def _get_mtime(self, origin):
+        """With COTTON_TEMPLATE_WATCHER set, the mtime comes from a background watcher of the template directories
+        rather than a stat per load."""
+        if self.watcher_kind:
+            if self.watcher is None:
+                # Imported here so that processes which don't watch templates don't load ctypes
+                from django_cotton.template_watcher import get_template_watcher
+
+                with self.watcher_lock:
+                    if self.watcher is None:
+                        self.watcher = get_template_watcher(
+                            self.get_dirs(),
+                            self.watcher_kind,
+                            getattr(settings, "COTTON_TEMPLATE_WATCHER_DELAY", 1.0),
+                        )
+
+            mtime = self.watcher.get_mtime(origin.name)
+            if mtime is None:
+                raise TemplateDoesNotExist(origin)
+
+            return mtime
+
+        try:
+            return os.path.getmtime(origin.name)
+        except FileNotFoundError:
+            raise TemplateDoesNotExist(origin)
+
+    def _get_plain_contents(self, origin, template_string=None):
+        """Templates without cotton syntax are left to the next loader, unless COTTON_SERVE_PLAIN_TEMPLATES is set, in which
+        case we serve them as they are to save the next loader reading the file again."""
+        if not self.serve_plain_templates:
             raise TemplateDoesNotExist(origin)
 
-        compiled_template = self.cotton_compiler.process(template_string, origin.template_name)
+        if template_string is None:
+            template_string = self._get_template_string(origin.name)
+
+        return template_string
+
+    def _get_built_contents(self, origin):
+        """Serve the template compiled by the cotton_compile management command. Entries are matched on the template's
+        path relative to its template dir, and which of our dirs that is, so a build made elsewhere (i.e. in CI) can be
+        served. Returns None for templates that aren't in the build, being plain templates, added since the build or
+        another dir's copy of a template, which are then loaded as usual."""
+        entry = self.get_manifest()["templates"].get(origin.template_name)
+
+        if entry is None or entry.get("dir") != self.get_template_dir_index(
+            origin.template_name, origin.name
+        ):
+            return None
+
+        with open(
+            os.path.join(settings.COTTON_BUILD_DIR, entry["compiled"]),
+            "r",
+            encoding=self.engine.file_charset,
+        ) as f:
+            compiled_template = f.read()
 
-        self.cache_handler.cache_template(cache_key, compiled_template)
+        origin.compiled_hash = entry["compiled_hash"]
 
         return compiled_template
 
+    def get_manifest(self):
+        """The manifest of the build in COTTON_BUILD_DIR, which must have been made with the settings we compile with,
+        as its templates would otherwise render differently from those compiled as they're
+        loaded."""
+        if self.manifest is None:
+            from django_cotton.build import get_build_settings
+
+            build_dir = getattr(settings, "COTTON_BUILD_DIR", None)
+            if build_dir is None:
+                raise ImproperlyConfigured(
+                    "COTTON_SERVE_FROM_BUILD requires COTTON_BUILD_DIR to be set."
+                )
+
+            try:
+                with open(os.path.join(build_dir, MANIFEST_FILENAME)) as f:
+                    self.manifest = json.load(f)
+            except FileNotFoundError:
+                raise ImproperlyConfigured(
+                    f"No cotton build found in '{build_dir}', run 'manage.py cotton_compile' first."
+                )
+
+            if self.manifest.get("settings") != get_build_settings():
+                raise ImproperlyConfigured(
+                    f"The cotton build in '{build_dir}' was made with other settings, run "
+                    "'manage.py cotton_compile' again."
+                )
+
+        return self.manifest
+
     def get_template_from_string(self, template_string):
         """Create and return a Template object from a string. Used primarily for testing."""
         return Template(template_string, engine=self.engine)
@@ -70,20 +338,68 @@ class Loader(BaseLoader):
             raise TemplateDoesNotExist(template_name)
 
     def get_dirs(self):
-        """This works like the file loader with APP_DIRS = True."""
-        dirs = self.dirs if self.dirs is not None else self.engine.dirs
+        """This works like the file loader with APP_DIRS = True. The directories are only looked up once."""
+        if self.template_dirs is None:
+            dirs = list(self.dirs if self.dirs is not None else self.engine.dirs)
+
+            for app_config in apps.get_app_configs():
+                template_dir = os.path.join(app_config.path, "templates")
+                if os.path.isdir(template_dir) and template_dir not in dirs:
+                    dirs.append(template_dir)
 
-        for app_config in apps.get_app_configs():
-            template_dir = os.path.join(app_config.path, "templates")
-            if os.path.isdir(template_dir):
-                dirs.append(template_dir)
+            self.template_dirs = tuple(dirs)
 
-        return dirs
+        return self.template_dirs
+
+    def get_template_files(self):
+        """Yield (template_name, path) for every template in the loader's directories. When the same template name
+        exists in more than one directory, only the first is yielded, as that is the one the loader would
+        serve."""
+        seen_dirs = set()
+        seen_names = set()
+
+        for template_dir in self.get_dirs():
+            template_dir = os.path.abspath(template_dir)
+            if template_dir in seen_dirs:
+                continue
+            seen_dirs.add(template_dir)
+
+            for root, dirs, files in os.walk(template_dir):
+                dirs.sort()
+                for file in sorted(files):
+                    path = os.path.join(root, file)
+                    template_name = os.path.relpath(path, template_dir).replace(os.sep, "/")
+
+                    if template_name not in seen_names:
+                        seen_names.add(template_name)
+                        yield template_name, path
+
+    def get_template_dir_index(self, template_name, path):
+        """The position among get_dirs() of the template dir that path is template_name in, or None."""
+        path = os.path.abspath(path)
+
+        for index, template_dir in enumerate(self.get_dirs()):
+            if os.path.abspath(os.path.join(template_dir, template_name)) == path:
+                return index
+
+        return None
 
     def get_template_sources(self, template_name):
         """Return an Origin object pointing to an absolute path in each directory
         in template_dirs. For security reasons, if a path doesn't lie inside
         one of the template_dirs it is excluded from the result set."""
+        indexed_name = None
+
+        if self.index_templates:
+            if self.template_index is None:
+                self.template_index = dict(self.get_template_files())
+
+            # The indexed template comes first, so it's usually the only one looked at. Templates added since the index
+            # was built, and those that {% extends %} the same name in another directory, are still found by looking in
+            # each directory after it.
+            if indexed_name := self.template_index.get(template_name):
+                yield Origin(name=indexed_name, template_name=template_name, loader=self)
+
         for template_dir in self.get_dirs():
             try:
                 name = safe_join(template_dir, template_name)
@@ -92,6 +408,9 @@ class Loader(BaseLoader):
                 # (it might be inside another one, so this isn't fatal).
                 continue
 
+            if name == indexed_name:
+                continue
+
             yield Origin(
                 name=name,
                 template_name=template_name,
@@ -99,284 +418,351 @@ class Loader(BaseLoader):
             )
 
 
-class UnsortedAttributes(HTMLFormatter):
-    """This keeps BS4 from re-ordering attributes"""
+def is_cotton_template(template_string):
+    """Whether the template contains any cotton syntax, so needs to be compiled."""
+    return "<c-" in template_string or "{% cotton_verbatim" in template_string
 
-    def attributes(self, tag):
-        for k, v in tag.attrs.items():
-            yield k, v
 
+def get_compiler():
+    """The compiler is selected with settings.COTTON_COMPILER, either "bs4" (default) or "tokenizer"."""
+    compiler = getattr(settings, "COTTON_COMPILER", "bs4")
 
-class CottonCompiler:
-    DJANGO_SYNTAX_PLACEHOLDER_PREFIX = "__django_syntax__"
-    COTTON_VERBATIM_PATTERN = re.compile(
-        r"\{% cotton_verbatim %\}(.*?)\{% endcotton_verbatim %\}", re.DOTALL
-    )
-    DJANGO_TAG_PATTERN = re.compile(r"(\s?)(\{%.*?%\})(\s?)")
-    DJANGO_VAR_PATTERN = re.compile(r"(\s?)(\{\{.*?\}\})(\s?)")
+    if compiler == "tokenizer":
+        return TokenizerCompiler()
 
-    def __init__(self):
-        self.django_syntax_placeholders = []
+    # Imported here so that processes which never compile, serving from the cache or a build, don't load bs4
+    from django_cotton.bs4_compiler import CottonCompiler
+
+    return CottonCompiler()
+
+
+def get_compiled_hash(compiled_template):
+    """A hash of the compiled output. The same source always compiles to the same output, so caches can key on this
+    instead of the template's mtime. The loader sets it on the template's origin as
+    origin.compiled_hash."""
+    return hashlib.sha256(compiled_template.encode()).hexdigest()
+
+
+class CompiledTemplate(str):
+    """A compiled template as kept in L1, holding its compiled hash so cache hits don't hash it again, and the
+    {template name: compiled hash} of the components inlined into it."""
+
+    dependencies = {}
+
+    def __new__(cls, content, dependencies=None):
+        compiled_template = super().__new__(cls, content)
+        if dependencies:
+            compiled_template.dependencies = dependencies
+
+        return compiled_template
+
+    @cached_property
+    def compiled_hash(self):
+        return get_compiled_hash(self)
 
-    def process(self, content, template_name):
-        content = self._replace_syntax_with_placeholders(content)
-        content = self._compile_cotton_to_django(content, template_name)
-        content = self._fix_bs4_attribute_empty_attribute_behaviour(content)
-        content = self._replace_placeholders_with_syntax(content)
-        content = self._remove_duplicate_attribute_markers(content)
 
+def as_compiled_template(content):
+    if isinstance(content, CompiledTemplate):
         return content
 
-    def _replace_syntax_with_placeholders(self, content):
-        """Replace {% ... %} and {{ ... }} with placeholders so they dont get touched
-        or encoded by bs4. We will replace them back after bs4 has done its job."""
-        self.django_syntax_placeholders = []
-
-        def replace_pattern(pattern, replacement_func):
-            return pattern.sub(replacement_func, content)
-
-        def replace_cotton_verbatim(match):
-            """{% cotton_verbatim %} protects the content through the bs4 parsing process when we want to actually print
-            cotton syntax in <pre> blocks."""
-            inner_content = match.group(1)
-            self.django_syntax_placeholders.append({"type": "verbatim", "content": inner_content})
-            return (
-                f"{self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX}{len(self.django_syntax_placeholders)}__"
-            )
+    return CompiledTemplate(content)
 
-        def replace_django_syntax(match):
-            """Store if the match had at least one space on the left or right side of the syntax so we can restore it later"""
-            left_space, syntax, right_space = match.groups()
-            self.django_syntax_placeholders.append(
-                {
-                    "type": "django",
-                    "content": syntax,
-                    "left_space": bool(left_space),
-                    "right_space": bool(right_space),
-                }
-            )
-            return (
-                f" {self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX}{len(self.django_syntax_placeholders)}__ "
+
+class CottonTemplateCacheHandler:
+    """Handles caching of cotton templates so the html parsing is only done on first load of each view or component.
+
+    Compiled templates are kept in an in-process LRU cache (L1) in front of django's cache (L2), so repeat loads don't
+    need a round-trip to a shared cache. Keys contain the template's mtime, so a changed template is never served stale.
+    """
+
+    def __init__(self):
+        self.enabled = getattr(settings, "COTTON_TEMPLATE_CACHING_ENABLED", True)
+        self.l1 = LRUCache(getattr(settings, "COTTON_TEMPLATE_CACHE_L1_SIZE", 1024))
+        self.l2_enabled = getattr(settings, "COTTON_TEMPLATE_CACHE_L2_ENABLED", True)
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.distributed_lock = getattr(settings, "COTTON_COMPILE_LOCK_ENABLED", False)
+        self.lock_wait = getattr(settings, "COTTON_COMPILE_LOCK_WAIT", 5)
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+        self.compression = getattr(settings, "COTTON_TEMPLATE_CACHE_COMPRESSION", None)
+        self.compression_threshold = getattr(
+            settings, "COTTON_TEMPLATE_CACHE_COMPRESSION_THRESHOLD", 1024
+        )
+        if self.compression is not None and self.compression not in COMPRESSION_CODECS:
+            raise ImproperlyConfigured(
+                f"COTTON_TEMPLATE_CACHE_COMPRESSION must be one of {', '.join(COMPRESSION_CODECS)}."
             )
+        self.bytes_before_compression = 0
+        self.bytes_after_compression = 0
+        self.decode_count = 0
+        self.decode_time = 0.0
+        stats.handlers.add(self)
 
-        # Replace cotton_verbatim blocks
-        content = replace_pattern(self.COTTON_VERBATIM_PATTERN, replace_cotton_verbatim)
+    def get_cache_key(self, template_name, mtime):
+        template_hash = hashlib.sha256(template_name.encode()).hexdigest()
+        return f"cotton_cache_v{cache_version}_g{cache_generation.get()}_{template_hash}_{mtime}"
+
+    def get_cached_template(self, cache_key):
+        if not self.enabled:
+            return None
 
-        # Replace {% ... %}
-        content = replace_pattern(self.DJANGO_TAG_PATTERN, replace_django_syntax)
+        content = self.l1.get(cache_key)
 
-        # Replace {{ ... }}
-        content = replace_pattern(self.DJANGO_VAR_PATTERN, replace_django_syntax)
+        if content is None and self.l2_enabled:
+            content = self._decode(cache.get(cache_key))
+
+            if content is None:
+                self.l2_misses += 1
+            else:
+                self.l2_hits += 1
+                content = self._set_l1(cache_key, content)
 
         return content
 
-    def _compile_cotton_to_django(self, html_content, template_name):
-        """Convert cotton <c-* syntax to {%."""
-        soup = BeautifulSoup(
-            html_content,
-            "html.parser",
-            on_duplicate_attribute=self.handle_duplicate_attributes,
-        )
+    def cache_template(self, cache_key, content, timeout=None):
+        """Cache a compiled template, returning it as it's kept in L1."""
+        if not self.enabled:
+            return as_compiled_template(content)
+
+        content = self._set_l1(cache_key, content)
+
+        if self.l2_enabled:
+            cache.set(cache_key, self._encode(content), timeout=timeout)
+
+        return content
+
+    def compile_once(self, cache_key, compile_template):
+        """Compile and cache a template, making sure concurrent misses for the same template only compile it once: the
+        first thread compiles whilst the others wait for its result. With COTTON_COMPILE_LOCK_ENABLED, this also goes
+        for other processes sharing the cache, which wait up to COTTON_COMPILE_LOCK_WAIT seconds before compiling the
+        template themselves."""
+        with self.locks_lock:
+            lock = self.locks.setdefault(cache_key, threading.Lock())
+
+        try:
+            with lock:
+                # Another thread may have compiled it whilst we waited
+                if (content := self.get_cached_template(cache_key)) is not None:
+                    return content
+
+                if self.distributed_lock and self.enabled and self.l2_enabled:
+                    return self._compile_with_distributed_lock(cache_key, compile_template)
+
+                return self.cache_template(cache_key, compile_template())
+        finally:
+            with self.locks_lock:
+                self.locks.pop(cache_key, None)
+
+    def _compile_with_distributed_lock(self, cache_key, compile_template):
+        lock_key = f"{cache_key}_lock"
 
-        # check if soup contains a 'c-vars' tag
-        if cvars_el := soup.find("c-vars"):
-            soup = self._wrap_with_cotton_vars_frame(soup, cvars_el)
+        if cache.add(lock_key, True, timeout=math.ceil(self.lock_wait) + 1):
+            try:
+                content = self.cache_template(cache_key, compile_template())
+            finally:
+                cache.delete(lock_key)
+
+            return content
+
+        deadline = time.monotonic() + self.lock_wait
 
-        self._transform_components(soup, template_name)
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
 
-        return str(soup.encode(formatter=UnsortedAttributes()).decode("utf-8"))
+            if (content := self._decode(cache.get(cache_key))) is not None:
+                self.l2_hits += 1
+                return self._set_l1(cache_key, content)
+
+        # The process holding the lock is taking too long, or has gone away
+        return self.cache_template(cache_key, compile_template())
+
+    def get_cached_templates(self, cache_keys):
+        """Like get_cached_template, for many templates at once, with a single round-trip to L2."""
+        if not self.enabled:
+            return {}
 
-    def _replace_placeholders_with_syntax(self, content):
-        """Replace placeholders with original syntax."""
-        for i, placeholder in enumerate(self.django_syntax_placeholders, 1):
-            if placeholder["type"] == "verbatim":
-                placeholder_pattern = f"{self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX}{i}__"
-                content = content.replace(placeholder_pattern, placeholder["content"])
+        found = {}
+        missing = []
+
+        for cache_key in cache_keys:
+            if (content := self.l1.get(cache_key)) is not None:
+                found[cache_key] = content
             else:
-                """
-                Construct the regex pattern based on original whitespace. This is to avoid unnecessary whitespace
-                changes in the output that can lead to unintended tag type mutations,
-                i.e. <div{% expr %}></div> --> <div__placeholder></div__placeholder> --> <div{% expr %}></div{% expr %}>
-                """
-                left_group = r"(\s*)" if not placeholder["left_space"] else ""
-                right_group = r"(\s*)" if not placeholder["right_space"] else ""
-                placeholder_pattern = (
-                    f"{left_group}{self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX}{i}__{right_group}"
+                missing.append(cache_key)
+
+        if missing and self.l2_enabled:
+            from_l2 = {
+                cache_key: content
+                for cache_key, value in cache.get_many(missing).items()
+                if (content := self._decode(value)) is not None
+            }
+            self.l2_hits += len(from_l2)
+            self.l2_misses += len(missing) - len(from_l2)
+
+            for cache_key, content in from_l2.items():
+                found[cache_key] = self._set_l1(cache_key, content)
+
+        return found
+
+    def cache_templates(self, templates, timeout=None):
+        """Like cache_template, for a dict of many templates at once, with a single round-trip to L2."""
+        if self.enabled and templates:
+            for cache_key, content in templates.items():
+                self._set_l1(cache_key, content)
+
+            if self.l2_enabled:
+                cache.set_many(
+                    {cache_key: self._encode(content) for cache_key, content in templates.items()},
+                    timeout=timeout,
                 )
 
-                content = re.sub(placeholder_pattern, placeholder["content"], content)
+    def _set_l1(self, cache_key, content):
+        content = as_compiled_template(content)
+        self.l1.set(cache_key, content)
 
         return content
 
-    def _remove_duplicate_attribute_markers(self, content):
-        return re.sub(r"__COTTON_DUPE_ATTR__[0-9A-F]{5}", "", content, flags=re.IGNORECASE)
-
-    def _fix_bs4_attribute_empty_attribute_behaviour(self, contents):
-        """Bs4 adds ="" to valueless attribute-like parts in HTML tags that causes issues when we want to manipulate
-        django expressions."""
-        contents = contents.replace('=""', "")
-
-        return contents
-
-    def _wrap_with_cotton_vars_frame(self, soup, cvars_el):
-        """If the user has defined a <c-vars> tag, wrap content with {% cotton_vars_frame %} to be able to create and
-        govern vars and attributes. To be able to defined new vars within a component and also have them available in the
-        same component's context, we wrap the entire contents in another component: cotton_vars_frame. Only when <c-vars>
-        is present."""
-
-        vars_with_defaults = []
-        for var, value in cvars_el.attrs.items():
-            # Attributes in context at this point will already have been formatted in _component to be accessible, so in order to cascade match the style.
-            accessible_var = var.replace("-", "_")
-
-            if value is None:
-                vars_with_defaults.append(f"{var}={accessible_var}")
-            elif var.startswith(":"):
-                # If ':' is present, the user wants to parse a literal string as the default value,
-                # i.e. "['a', 'b']", "{'a': 'b'}", "True", "False", "None" or "1".
-                var = var[1:]  # Remove the ':' prefix
-                accessible_var = accessible_var[1:]  # Remove the ':' prefix
-                vars_with_defaults.append(f'{var}={accessible_var}|eval_default:"{value}"')
-            else:
-                # Assuming value is already a string that represents the default value
-                vars_with_defaults.append(f'{var}={accessible_var}|default:"{value}"')
+    @property
+    def compression_ratio(self):
+        """Size of the compressed entries relative to their original size, i.e. 0.2 means they shrunk by 80%."""
+        if not self.bytes_before_compression:
+            return None
 
-        cvars_el.decompose()
+        return self.bytes_after_compression / self.bytes_before_compression
 
-        # Construct the {% with %} opening tag
-        opening = "{% cotton_vars_frame " + " ".join(vars_with_defaults) + " %}"
-        closing = "{% endcotton_vars_frame %}"
+    def _encode(self, content):
+        """Compress templates bigger than COTTON_TEMPLATE_CACHE_COMPRESSION_THRESHOLD bytes for L2, wrapped in an
+        envelope recording the format and codec. Smaller templates are stored as they are. Templates with inlined
+        components are wrapped in another envelope, holding their dependencies."""
+        dependencies = getattr(content, "dependencies", None)
+        content = self._compress(str(content))
 
-        # Convert the remaining soup back to a string and wrap it within {% with %} block
-        wrapped_content = (
-            opening
-            + str(soup.encode(formatter=UnsortedAttributes()).decode("utf-8")).strip()
-            + closing
-        )
+        if dependencies:
+            return (INLINED_ENVELOPE, INLINED_ENVELOPE_VERSION, dependencies, content)
 
-        # Since we can't replace the soup object itself, we create new soup instead
-        new_soup = BeautifulSoup(
-            wrapped_content,
-            "html.parser",
-            on_duplicate_attribute=self.handle_duplicate_attributes,
-        )
+        return content
 
-        return new_soup
+    def _compress(self, content):
+        if self.compression is None:
+            return content
 
-    def _transform_components(self, soup, parent_key):
-        """Replace <c-[component path]> tags with the {% cotton_component %} template tag"""
-        for tag in soup.find_all(re.compile("^c-"), recursive=True):
-            if tag.name == "c-slot":
-                self._transform_named_slot(tag, parent_key)
+        data = content.encode()
+        if len(data) < self.compression_threshold:
+            return content
 
-                continue
+        compressed = COMPRESSION_CODECS[self.compression][0](data)
+        self.bytes_before_compression += len(data)
+        self.bytes_after_compression += len(compressed)
 
-            component_key = tag.name[2:]
-            component_path = component_key.replace(".", "/").replace("-", "_")
-            opening_tag = f"{{% cotton_component {'{}/{}.html'.format(settings.COTTON_DIR if hasattr(settings, 'COTTON_DIR') else 'cotton', component_path)} {component_key} "
+        return (COMPRESSION_ENVELOPE, COMPRESSION_ENVELOPE_VERSION, self.compression, compressed)
 
-            # Store attributes that contain template expressions, they are when we use '{{' or '{%' in the value of an attribute
-            expression_attrs = []
+    def _decode(self, value):
+        """Unwrap a value read from L2. Values we can't decode, i.e. written by a newer version, are treated as misses."""
+        if value is None or isinstance(value, str):
+            return value
 
-            # Build the attributes
-            for key, value in tag.attrs.items():
-                # BS4 stores class values as a list, so we need to join them back into a string
-                if key == "class":
-                    value = " ".join(value)
+        try:
+            envelope, version, codec, compressed = value
+        except (TypeError, ValueError):
+            return None
 
-                # Django templates tags cannot have {{ or {% expressions in their attribute values
-                # Neither can they have new lines, let's treat them both as "expression attrs"
-                if self.DJANGO_SYNTAX_PLACEHOLDER_PREFIX in value or "\n" in value or "=" in value:
-                    expression_attrs.append((key, value))
-                    continue
+        if envelope == INLINED_ENVELOPE and version == INLINED_ENVELOPE_VERSION:
+            dependencies, content = codec, self._decode(compressed)
+            if content is None or not isinstance(dependencies, dict):
+                return None
 
-                opening_tag += ' {}="{}"'.format(key, value)
-            opening_tag += " %}"
+            return CompiledTemplate(content, dependencies)
 
-            component_tag = opening_tag
+        if envelope != COMPRESSION_ENVELOPE or version != COMPRESSION_ENVELOPE_VERSION:
+            return None
+        if codec not in COMPRESSION_CODECS:
+            return None
 
-            if expression_attrs:
-                for key, value in expression_attrs:
-                    component_tag += f"{{% cotton_slot {key} {component_key} expression_attr %}}{value}{{% end_cotton_slot %}}"
+        start_time = time.perf_counter()
+        content = COMPRESSION_CODECS[codec][1](compressed).decode()
+        self.decode_time += time.perf_counter() - start_time
+        self.decode_count += 1
 
-            if tag.contents:
-                tag_soup = BeautifulSoup(
-                    tag.decode_contents(),
-                    "html.parser",
-                    on_duplicate_attribute=self.handle_duplicate_attributes,
-                )
-                self._transform_components(tag_soup, component_key)
-                component_tag += str(
-                    tag_soup.encode(formatter=UnsortedAttributes()).decode("utf-8")
-                )
+        return content
 
-            component_tag += "{% end_cotton_component %}"
 
-            # Replace the original tag with the compiled django syntax
-            new_soup = BeautifulSoup(
-                component_tag,
-                "html.parser",
-                on_duplicate_attribute=self.handle_duplicate_attributes,
-            )
-            tag.replace_with(new_soup)
+class CacheGeneration:
+    """A counter kept in django's cache that's part of every cotton cache key, so bumping it drops all compiled templates
+    at once without touching anything else in the cache. Each process checks for a new generation at most every
+    COTTON_CACHE_GENERATION_TTL seconds, when loading templates. With COTTON_TEMPLATE_CACHE_L2_ENABLED off nothing is
+    shared between processes, so neither is the counter, which is then kept in-process."""
 
-        return soup
+    cache_key = "cotton_cache_generation"
 
-    def _transform_named_slot(self, slot_tag, component_key):
-        """Compile <c-slot> to {% cotton_slot %}"""
-        slot_name = slot_tag.get("name", "").strip()
-        inner_html = "".join(str(content) for content in slot_tag.contents)
+    def __init__(self):
+        self.value = None
+        self.checked_at = 0
 
-        # Check and process any components in the slot content
-        slot_soup = BeautifulSoup(
-            inner_html,
-            "html.parser",
-            on_duplicate_attribute=self.handle_duplicate_attributes,
-        )
-        self._transform_components(slot_soup, component_key)
+    def is_shared(self):
+        return getattr(settings, "COTTON_TEMPLATE_CACHE_L2_ENABLED", True)
 
-        cotton_slot_tag = f"{{% cotton_slot {slot_name} {component_key} %}}{str(slot_soup.encode(formatter=UnsortedAttributes()).decode('utf-8'))}{{% end_cotton_slot %}}"
+    def get(self, refresh=True):
+        """The current generation. Without refresh, the one this process last saw is returned as it is, for use whilst
+        rendering, where we don't want to wait on the cache."""
+        if self.value is not None and not refresh:
+            return self.value
 
-        slot_tag.replace_with(
-            BeautifulSoup(
-                cotton_slot_tag,
-                "html.parser",
-                on_duplicate_attribute=self.handle_duplicate_attributes,
-            )
-        )
+        now = time.monotonic()
+        ttl = getattr(settings, "COTTON_CACHE_GENERATION_TTL", 1)
 
-    @staticmethod
-    def handle_duplicate_attributes(tag_attrs, key, value):
-        """BS4 cleans html and removes duplicate attributes. This would be fine if our target was html, but actually
-        we're targeting Django Template Language. This contains expressions to govern content including attributes of
-        any XML-like tag. It's perfectly fine to expect duplicate attributes per tag in DTL:
+        if not self.is_shared():
+            if self.value is None:
+                self.value = self.get_initial_value()
+        elif self.value is None or now - self.checked_at > ttl:
+            self.value = cache.get(self.cache_key)
 
-        <a href="#" {% if something %} class="this" {% else %} class="that" {% endif %}>Hello</a>
+            if self.value is None:
+                cache.add(self.cache_key, self.get_initial_value(), timeout=None)
+                self.value = cache.get(self.cache_key, 0)
 
-        The solution here is to make duplicate attribute keys unique across that tag so BS4 will not attempt to merge or
-        replace existing. Then in post processing we'll remove the unique mask.
-        """
-        key_id = "".join(random.choice("0123456789ABCDEF") for i in range(5))
-        key = f"{key}__COTTON_DUPE_ATTR__{key_id}"
-        tag_attrs[key] = value
+            self.checked_at = now
 
+        return self.value
 
-class CottonTemplateCacheHandler:
-    """Handles caching of cotton templates so the html parsing is only done on first load of each view or component."""
+    def bump(self):
+        if not self.is_shared():
+            self.value = self.get() + 1
+            return self.value
 
-    def __init__(self):
-        self.enabled = getattr(settings, "COTTON_TEMPLATE_CACHING_ENABLED", True)
+        cache.add(self.cache_key, self.get_initial_value(), timeout=None)
 
-    def get_cache_key(self, template_name, mtime):
-        template_hash = hashlib.sha256(template_name.encode()).hexdigest()
-        return f"cotton_cache_v{cache_version}_{template_hash}_{mtime}"
+        try:
+            self.value = cache.incr(self.cache_key)
+        except ValueError:
+            # The counter was evicted in between
+            self.value = self.get_initial_value()
+            cache.set(self.cache_key, self.value, timeout=None)
 
-    def get_cached_template(self, cache_key):
-        if not self.enabled:
-            return None
+        self.checked_at = time.monotonic()
 
-        return cache.get(cache_key)
+        return self.value
 
-    def cache_template(self, cache_key, content, timeout=None):
-        if self.enabled:
-            cache.set(cache_key, content, timeout=timeout)
+    def get_initial_value(self):
+        """The counter can be lost when the cache is cleared or evicts it, whilst the templates compiled for its old
+        generations are still held in-process, so it starts again from a generation that can't have been used
+        yet."""
+        return time.time_ns() // 1000
+
+
+cache_generation = CacheGeneration()
+
+
+def invalidate_cotton_cache():
+    """Drop all compiled cotton templates from the cache, for every process sharing it. Returns the new generation."""
+    return cache_generation.bump()
+
+
+def __getattr__(name):
+    # CottonCompiler lived here before it moved out with bs4, which we only import once needed
+    if name in ("CottonCompiler", "UnsortedAttributes"):
+        from django_cotton import bs4_compiler
+
+        return getattr(bs4_compiler, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
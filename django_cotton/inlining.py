@@ -0,0 +1,110 @@
+import re
+
+from django.conf import settings
+from django.utils.text import smart_split
+
+from django_cotton.utils import ensure_quoted
+
+# A component with an empty body, compiled
+COMPONENT_PATTERN = re.compile(
+    r"\{% cotton_component ((?:(?!%\}).)*?) ?%\}\{% end_cotton_component %\}", re.DOTALL
+)
+# Characters that autoescaping would change, which static values mustn't contain as they become safe strings when inlined
+UNSAFE_CHARACTERS = re.compile(r"""[<>&'"\\]""")
+# What a component's template mustn't use for it to be inlined: only the component node provides these, they'd change
+# the parsing of the rest of the parent template, they keep state for each template rendered, or they're relative to
+# the component's template, i.e. {% include "./icon.html" %}
+NON_INLINABLE_SYNTAX = re.compile(
+    r"\{% ?(?:cotton_vars_frame|extends|block|load|cycle|ifchanged)\b|attrs_dict|\|\s*merge\b"
+    r"""|\{%\s*include\s+["']\.\.?/"""
+)
+# Blocks changing how what's inside them renders, which a component renders without
+RENDER_SETTINGS_SYNTAX = re.compile(r"\{% ?(?:autoescape|localize|localtime|timezone)\b")
+
+
+def inline_components(compiled_template, get_component):
+    """Replace the components in a compiled template that have only static attributes and no content with their
+    template, wrapped in a {% with %} giving it the attrs the component would have had. get_component(template_name)
+    returns the component's compiled template, or None when it can't be inlined.
+
+    Returns the compiled template and the {template name: compiled hash} of the components inlined into it, including
+    those inlined into them, so that it can be compiled again once one changes. These are kept out of the compiled
+    template, so the same source always compiles to the same output.
+
+    Nothing is inlined into templates that change autoescaping, localization or the timezone for a block, as a
+    component used in such a block would render as the block does, rather than as it does on its
+    own."""
+    if RENDER_SETTINGS_SYNTAX.search(compiled_template):
+        return compiled_template, {}
+
+    max_size = getattr(settings, "COTTON_INLINE_COMPONENTS_MAX_SIZE", 2048)
+    dependencies = {}
+
+    def inline(match):
+        if "{%" in match.group(1):
+            return match.group(0)
+
+        bits = list(smart_split(match.group(1)))
+        # Components isolated with c-only don't see the template using them, which they would once inlined
+        if bits[0] == "only":
+            return match.group(0)
+
+        template_name, attrs = bits[0], get_static_attrs(bits[2:])
+        if attrs is None:
+            return match.group(0)
+
+        component = get_component(template_name)
+        if component is None:
+            return match.group(0)
+
+        if len(component) > max_size or NON_INLINABLE_SYNTAX.search(component):
+            return match.group(0)
+
+        dependencies.update(component.dependencies)
+        dependencies[template_name] = component.compiled_hash
+
+        return f"{{% with {get_with_arguments(attrs)} %}}{component}{{% endwith %}}"
+
+    return COMPONENT_PATTERN.sub(inline, compiled_template), dependencies
+
+
+def get_static_attrs(bits):
+    """The component's attributes, as the component tag would give them, or None if any of them aren't static."""
+    attrs = {}
+
+    for bit in bits:
+        if bit.startswith(":") or bit.count("=") > 1:
+            return None
+
+        key, _, value = bit.partition("=")
+
+        # strip single or double quotes only if both sides have them
+        if value and value[0] == value[-1] and value[0] in ('"', "'"):
+            value = value[1:-1]
+
+        if UNSAFE_CHARACTERS.search(value):
+            return None
+
+        attrs[key] = value or True
+
+    return attrs
+
+
+def get_with_arguments(attrs):
+    attrs_string = " ".join(f"{key}={ensure_quoted(value)}" for key, value in attrs.items())
+    arguments = {"attrs": attrs_string, "slot": ""}
+
+    for key, value in attrs.items():
+        context_key = key.replace("-", "_")
+        # Attributes like @click can't be used as variables anyway
+        if context_key.isidentifier():
+            arguments[context_key] = value
+
+    return " ".join(
+        f"{key}=True" if value is True else f'{key}="{escape_string(value)}"'
+        for key, value in arguments.items()
+    )
+
+
+def escape_string(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
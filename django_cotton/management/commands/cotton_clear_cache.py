@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from django_cotton.cotton_loader import invalidate_cotton_cache
+
+
+class Command(BaseCommand):
+    help = "Drop all compiled cotton templates from the cache, leaving the rest of the cache untouched."
+
+    def handle(self, *args, **options):
+        generation = invalidate_cotton_cache()
+
+        self.stdout.write(self.style.SUCCESS(f"Cotton cache cleared (generation {generation})."))
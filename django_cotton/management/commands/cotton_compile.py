@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from django_cotton.build import compile_templates
+
+
+class Command(BaseCommand):
+    help = "Compile all cotton templates ahead of time into COTTON_BUILD_DIR, to be served with COTTON_SERVE_FROM_BUILD."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--build-dir",
+            default=getattr(settings, "COTTON_BUILD_DIR", None),
+            help="Directory to write the compiled templates and manifest to (default: COTTON_BUILD_DIR).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes to compile templates with (default: 1).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recompile all templates, including those unchanged since the last build.",
+        )
+
+    def handle(self, *args, **options):
+        build_dir = options["build_dir"]
+        if not build_dir:
+            raise CommandError("Set COTTON_BUILD_DIR or pass --build-dir.")
+
+        start_time = time.perf_counter()
+        result = compile_templates(build_dir, workers=options["workers"], force=options["force"])
+        elapsed = time.perf_counter() - start_time
+
+        if options["verbosity"] > 1:
+            for template_name, seconds in sorted(result.timings.items(), key=lambda item: -item[1]):
+                self.stdout.write(f"{seconds * 1000:8.1f}ms  {template_name}")
+
+        for template_name, error in result.errors.items():
+            self.stderr.write(f"{template_name}: {error}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compiled {len(result.compiled)} templates to '{build_dir}' in {elapsed:.2f}s, "
+                f"skipped {len(result.skipped)} unchanged."
+            )
+        )
+
+        if result.errors:
+            raise CommandError(f"{len(result.errors)} templates failed to compile.")
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_cotton.stats import get_json_stats, get_stats, stats
+from django_cotton.warm_up import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "With --warm-up, load every cotton template in this process, as a freshly started server would, and print "
+        "its loader stats: L1 and L2 hits and misses and the time spent compiling each template. These are the stats "
+        "of this command's own process. For a running server's, add django_cotton.stats.stats_view to your urls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--warm-up",
+            action="store_true",
+            help=(
+                "Compile and load every cotton template to measure. Like COTTON_WARM_UP, this fills django's cache "
+                "with the compiled templates, unless COTTON_TEMPLATE_CACHE_L2_ENABLED is off."
+            ),
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the stats as JSON, as returned by get_stats().",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=10,
+            help="Number of the slowest templates to list (default: 10).",
+        )
+
+    def handle(self, *args, **options):
+        if not options["warm_up"]:
+            raise CommandError(
+                "This command can only report the stats of its own process, which hasn't loaded any templates. "
+                "Pass --warm-up to load every template in it, or add django_cotton.stats.stats_view to your urls "
+                "to see a running server's stats."
+            )
+
+        stats.enabled = True
+        warm_up(background=False)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(get_json_stats(), indent=2, sort_keys=True))
+            return
+
+        result = get_stats()
+
+        l1, l2 = result["l1"], result["l2"]
+        self.stdout.write(f"L1: {l1['hits']} hits, {l1['misses']} misses, {l1['size']} entries")
+        self.stdout.write(f"L2: {l2['hits']} hits, {l2['misses']} misses")
+        components = result["components"]
+        self.stdout.write(
+            f"Component templates: {components['hits']} hits, {components['misses']} misses, "
+            f"{components['size']} entries"
+        )
+        self.stdout.write(
+            f"Compiled {result['compile_count']} templates in {result['compile_time'] * 1000:.1f}ms, "
+            f"{result['bytes_in']} bytes in, {result['bytes_out']} bytes out"
+        )
+
+        self.stdout.write("Compile times:")
+        lower = 0
+        for bound, count in result["compile_time_histogram"].items():
+            label = f">{lower * 1000:g}ms" if bound == float("inf") else f"<={bound * 1000:g}ms"
+            self.stdout.write(f"  {label:>9}  {count}")
+            lower = bound
+
+        templates = sorted(result["templates"].items(), key=lambda item: -item[1]["compile_time"])
+        slowest = templates[: options["limit"]]
+        if slowest:
+            self.stdout.write("Slowest templates:")
+            for template_name, template in slowest:
+                self.stdout.write(f"  {template['compile_time'] * 1000:8.1f}ms  {template_name}")
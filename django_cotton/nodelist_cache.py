@@ -0,0 +1,127 @@
+import gc
+import hashlib
+import io
+import pickle
+
+import django
+from django.core.cache import cache
+from django.template import Template
+from django.template.smartif import OPERATORS, TokenBase
+
+from django_cotton.cotton_loader import cache_generation, cache_version
+
+# Cached in place of the nodelist of templates that can't be pickled, so we only try once
+UNPICKLABLE = "unpicklable"
+
+
+class PreparsedTemplate(Template):
+    """A Template built from a nodelist that has already been parsed, rather than from its source."""
+
+    def __init__(self, template_string, origin, name, engine, nodelist):
+        self.preparsed_nodelist = nodelist
+        super().__init__(template_string, origin, name, engine)
+
+    def compile_nodelist(self):
+        return self.preparsed_nodelist
+
+
+class NodelistPickler(pickle.Pickler):
+    """Pickles a template's nodelist without its origin and engine, which every node refers to, so they can be swapped
+    for those of the template it's unpickled into."""
+
+    def __init__(self, file, template):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.template = template
+
+    def persistent_id(self, obj):
+        if obj is self.template.origin:
+            return "origin"
+        if obj is self.template.engine:
+            return "engine"
+        return None
+
+    def reducer_override(self, obj):
+        # The operators of {% if %} conditions are classes made on the fly, which pickle can't find by name
+        if isinstance(obj, TokenBase) and OPERATORS.get(getattr(obj, "id", None)) is type(obj):
+            return _rebuild_operator, (obj.id, obj.__dict__)
+        return NotImplemented
+
+
+class NodelistUnpickler(pickle.Unpickler):
+    def __init__(self, file, origin, engine):
+        super().__init__(file)
+        # Called for every node, so a dict lookup rather than a method
+        self.persistent_load = {"origin": origin, "engine": engine}.__getitem__
+
+
+def _rebuild_operator(operator_id, state):
+    operator = OPERATORS[operator_id]()
+    operator.__dict__.update(state)
+    return operator
+
+
+def dump_nodelist(template):
+    file = io.BytesIO()
+    NodelistPickler(file, template).dump(template.nodelist)
+    return file.getvalue()
+
+
+def load_nodelist(data, origin, engine):
+    # Unpickling a big nodelist creates enough objects to set off the garbage collector over and over, more than doubling
+    # the time it takes, when they're all going to be kept alive by the template anyway
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        return NodelistUnpickler(io.BytesIO(data), origin, engine).load()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def get_engine_key(engine):
+    """Everything about the engine that changes how a template is parsed."""
+    engine_settings = repr(
+        (
+            django.get_version(),
+            engine.debug,
+            sorted(engine.libraries.items()),
+            engine.builtins,
+        )
+    )
+    return hashlib.sha256(engine_settings.encode()).hexdigest()[:16]
+
+
+def get_nodelist_cache_key(compiled_hash, engine_key):
+    return (
+        f"cotton_nodelist_v{cache_version}_g{cache_generation.get()}_{compiled_hash}_{engine_key}"
+    )
+
+
+def get_template(contents, origin, engine, engine_key):
+    """Build the Template for a compiled cotton template from the nodelist in django's cache, parsing it and caching
+    the nodelist for other processes when there isn't one. Templates that can't be pickled, i.e. because a third party
+    tag holds a lambda, are parsed as usual."""
+    cache_key = get_nodelist_cache_key(origin.compiled_hash, engine_key)
+    data = cache.get(cache_key)
+
+    if data is not None and data != UNPICKLABLE:
+        try:
+            nodelist = load_nodelist(data, origin, engine)
+        except Exception:
+            # i.e. a tag library has changed since it was pickled, so we replace it
+            data = None
+        else:
+            return PreparsedTemplate(contents, origin, origin.template_name, engine, nodelist)
+
+    template = Template(contents, origin, origin.template_name, engine)
+
+    if data is None:
+        try:
+            data = dump_nodelist(template)
+        except Exception:
+            data = UNPICKLABLE
+
+        cache.set(cache_key, data, timeout=None)
+
+    return template
@@ -0,0 +1,144 @@
+import math
+import threading
+import weakref
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+
+
+class CottonStats:
+    """Process-local counters for the cotton loaders: L1, L2 and component template cache hits and misses, and how many
+    templates were compiled, how long that took (in total, per template and as a histogram) and the size of the templates
+    going in and out of the compiler. Compiles are only timed with COTTON_STATS_ENABLED, the cache counters are always
+    kept."""
+
+    # Upper bounds of the compile time histogram buckets, in seconds
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, math.inf)
+
+    def __init__(self):
+        self._enabled = None
+        self._lock = threading.Lock()
+        # The cache handlers of every loader in the process, to sum their counters
+        self.handlers = weakref.WeakSet()
+        self.reset_counters()
+
+    @property
+    def enabled(self):
+        if self._enabled is None:
+            self._enabled = getattr(settings, "COTTON_STATS_ENABLED", False)
+
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    def reset(self):
+        # Imported here as the template tags import the loader, which imports us
+        from django_cotton.templatetags._component import component_templates
+
+        self.reset_counters()
+        component_templates.hits = component_templates.misses = 0
+
+        for handler in list(self.handlers):
+            handler.l1.hits = handler.l1.misses = 0
+            handler.l2_hits = handler.l2_misses = 0
+
+    def reset_counters(self):
+        with self._lock:
+            self.compile_count = 0
+            self.compile_time = 0.0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.histogram = [0] * len(self.BUCKETS)
+            # [compiles, total time, max time] by template name
+            self.templates = {}
+
+    def record_compile(self, template_name, seconds, template_string, compiled_template):
+        bytes_in = len(template_string.encode())
+        bytes_out = len(compiled_template.encode())
+        bucket = next(i for i, bound in enumerate(self.BUCKETS) if seconds <= bound)
+
+        with self._lock:
+            self.compile_count += 1
+            self.compile_time += seconds
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.histogram[bucket] += 1
+
+            template = self.templates.setdefault(template_name, [0, 0.0, 0.0])
+            template[0] += 1
+            template[1] += seconds
+            template[2] = max(template[2], seconds)
+
+    def as_dict(self):
+        from django_cotton.templatetags._component import component_templates
+
+        handlers = list(self.handlers)
+
+        with self._lock:
+            return {
+                "l1": {
+                    "hits": sum(handler.l1.hits for handler in handlers),
+                    "misses": sum(handler.l1.misses for handler in handlers),
+                    "size": sum(len(handler.l1) for handler in handlers),
+                },
+                "l2": {
+                    "hits": sum(handler.l2_hits for handler in handlers),
+                    "misses": sum(handler.l2_misses for handler in handlers),
+                },
+                "components": {
+                    "hits": component_templates.hits,
+                    "misses": component_templates.misses,
+                    "size": len(component_templates),
+                },
+                "compile_count": self.compile_count,
+                "compile_time": self.compile_time,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "compile_time_histogram": {
+                    bound: count for bound, count in zip(self.BUCKETS, self.histogram)
+                },
+                "templates": {
+                    template_name: {
+                        "compile_count": count,
+                        "compile_time": total,
+                        "max_compile_time": slowest,
+                    }
+                    for template_name, (count, total, slowest) in self.templates.items()
+                },
+            }
+
+
+stats = CottonStats()
+
+
+def get_stats():
+    """The cotton loader stats of this process, as a dict. Compile times are in seconds and the histogram is keyed by the
+    upper bound of each bucket."""
+    return stats.as_dict()
+
+
+def get_json_stats():
+    """get_stats(), with the histogram keyed by strings so it can be dumped as JSON."""
+    result = get_stats()
+    result["compile_time_histogram"] = {
+        str(bound): count for bound, count in result["compile_time_histogram"].items()
+    }
+
+    return result
+
+
+def reset_stats():
+    stats.reset()
+
+
+def stats_view(request):
+    """The stats of the process serving the request, as JSON, for staff users. Add it to your urls, i.e.
+    path("cotton-stats/", stats_view), to see how a running server's loaders are doing."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_staff:
+        raise PermissionDenied
+
+    return JsonResponse(get_json_stats())
@@ -0,0 +1,194 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+class TemplateWatcher:
+    """Keeps the mtime of every file in the template directories up to date in the background, so the loader can look
+    them up without touching the filesystem. Files that don't exist have no mtime. The directories are rescanned every
+    `delay` seconds, which works everywhere; InotifyWatcher is told of changes by the kernel
+    instead."""
+
+    def __init__(self, dirs, delay):
+        self.dirs = [os.path.abspath(template_dir) for template_dir in dirs]
+        self.delay = delay
+        self.mtimes = {}
+        self._stop = threading.Event()
+
+    def start(self):
+        self.mtimes = self.scan(self.dirs)
+        threading.Thread(target=self.run, name=type(self).__name__, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_mtime(self, path):
+        return self.mtimes.get(path)
+
+    def run(self):
+        while not self._stop.wait(self.delay):
+            self.mtimes = self.scan(self.dirs)
+
+    def scan(self, dirs):
+        """Return the mtime of every file under dirs, by path."""
+        mtimes = {}
+
+        for path in self.walk(dirs):
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+
+        return mtimes
+
+    def walk(self, dirs, on_dir=None):
+        """Yield the path of every file under dirs, following symlinks as the loader does. A directory linked to more
+        than once within a template dir is only walked once, but template dirs that are (or contain) the same
+        directory are each walked, as the loader finds their templates by their own paths."""
+        for template_dir in dirs:
+            seen = set()
+
+            for root, subdirs, files in os.walk(template_dir, followlinks=True):
+                real_root = os.path.realpath(root)
+                if real_root in seen:
+                    subdirs[:] = []
+                    continue
+                seen.add(real_root)
+
+                if on_dir is not None:
+                    on_dir(root)
+
+                for file in files:
+                    yield os.path.join(root, file)
+
+
+class InotifyWatcher(TemplateWatcher):
+    """Updates mtimes as the kernel reports changes to the template directories, on Linux."""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    )
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, dirs, delay):
+        super().__init__(dirs, delay)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = None
+        # The paths of each watched directory, by watch descriptor: one directory can be watched under several paths
+        self.watched_dirs = {}
+
+    @classmethod
+    def is_available(cls):
+        if not sys.platform.startswith("linux"):
+            return False
+
+        try:
+            return hasattr(ctypes.CDLL(ctypes.util.find_library("c")), "inotify_init1")
+        except OSError:
+            return False
+
+    def start(self):
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.mtimes = self.scan_and_watch(self.dirs)
+        threading.Thread(target=self.run, name=type(self).__name__, daemon=True).start()
+
+    def scan_and_watch(self, dirs):
+        mtimes = {}
+
+        for path in self.walk(dirs, on_dir=self.watch):
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+
+        return mtimes
+
+    def watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd >= 0:
+            self.watched_dirs.setdefault(wd, set()).add(path)
+
+    def run(self):
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([self.fd], [], [], self.delay)
+                if readable:
+                    self.handle_events(os.read(self.fd, 64 * 1024))
+        finally:
+            os.close(self.fd)
+
+    def handle_events(self, data):
+        mtimes = dict(self.mtimes)
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + self.EVENT_HEADER.size : offset + self.EVENT_HEADER.size + length]
+            offset += self.EVENT_HEADER.size + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # We missed events, start again from the files on disk
+                mtimes = self.scan_and_watch(self.dirs)
+                continue
+
+            if wd not in self.watched_dirs or not name:
+                continue
+
+            for watched_dir in list(self.watched_dirs[wd]):
+                path = os.path.join(watched_dir, os.fsdecode(name.rstrip(b"\0")))
+
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        mtimes.update(self.scan_and_watch([path]))
+                    elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        prefix = path + os.sep
+                        mtimes = {p: m for p, m in mtimes.items() if not p.startswith(prefix)}
+                    continue
+
+                try:
+                    mtimes[path] = os.path.getmtime(path)
+                except OSError:
+                    mtimes.pop(path, None)
+
+        self.mtimes = mtimes
+
+
+def get_template_watcher(dirs, watcher, delay):
+    """Start a watcher of the given kind: "inotify", "polling" or "auto", which uses inotify where available."""
+    if watcher not in ("inotify", "polling", "auto"):
+        raise ImproperlyConfigured(
+            'COTTON_TEMPLATE_WATCHER must be one of "inotify", "polling" or "auto".'
+        )
+
+    if watcher == "auto":
+        watcher = "inotify" if InotifyWatcher.is_available() else "polling"
+    elif watcher == "inotify" and not InotifyWatcher.is_available():
+        raise ImproperlyConfigured(
+            'COTTON_TEMPLATE_WATCHER is "inotify", which is only available on Linux. Use "auto" to fall back to '
+            '"polling" elsewhere.'
+        )
+
+    watcher_class = InotifyWatcher if watcher == "inotify" else TemplateWatcher
+    template_watcher = watcher_class(dirs, delay)
+    template_watcher.start()
+
+    return template_watcher
@@ -1,26 +1,72 @@
 import ast
-from functools import lru_cache
+import os
 
 from django import template
 from django.conf import settings
-from django.template import Node
-from django.template.loader import get_template
-from django.utils.safestring import mark_safe
+from django.template import Engine, Node, TemplateDoesNotExist
 
-from django_cotton.utils import ensure_quoted
+from django_cotton.cotton_loader import Loader, cache_generation
+from django_cotton.lru_cache import LRUCache
+from django_cotton.utils import Attrs, ensure_quoted
 
+# Component templates by (engine, template name), holding at most COTTON_COMPONENT_CACHE_SIZE of them
+component_templates = LRUCache(getattr(settings, "COTTON_COMPONENT_CACHE_SIZE", 1024))
 
-@lru_cache(maxsize=1024)
-def get_cached_template(template_name):
-    """App runtime cache for cotton templates. Turned on only when DEBUG=False."""
-    return get_template(template_name)
 
+class ComponentTemplate:
+    """A component's template as loaded by an engine, along with what we need to tell whether it's still current: it
+    isn't once the cotton cache is invalidated or once the template's file has changed. This is checked on every
+    render, so against the cache generation this process last saw when loading templates, rather than asking the
+    cache, and with the cotton loader's mtimes, which come from COTTON_TEMPLATE_WATCHER when it's
+    set."""
 
-def render_template(template_name, context):
-    if settings.DEBUG:
-        return get_template(template_name).render(context)
+    def __init__(self, template, engine):
+        self.template = template
+        self.engine = engine
+        self.generation = cache_generation.get(refresh=False)
+        self.mtime = self.get_mtime()
+
+    def get_mtime(self):
+        origin = self.template.origin
+
+        try:
+            if isinstance(origin.loader, Loader):
+                return origin.loader._get_mtime(origin)
+
+            return os.path.getmtime(origin.name)
+        except (OSError, TypeError, TemplateDoesNotExist):
+            return None
+
+    def is_current(self):
+        if self.generation != cache_generation.get(refresh=False):
+            return False
+
+        return self.get_mtime() == self.mtime
+
+    def load_again(self):
+        """The engine's cached loader would return the template as it was, so it's loaded by its own loader instead."""
+        origin = self.template.origin
+        if origin.loader is None:
+            return self.engine.get_template(origin.template_name)
+
+        return origin.loader.get_template(origin.template_name)
+
+
+def get_component_template(template_name, engine):
+    key = (engine, template_name)
+    component_template = component_templates.get(key)
+
+    if component_template is None:
+        template = engine.get_template(template_name)
+    elif not component_template.is_current():
+        template = component_template.load_again()
     else:
-        return get_cached_template(template_name).render(context)
+        return component_template
+
+    component_template = ComponentTemplate(template, engine)
+    component_templates.set(key, component_template)
+
+    return component_template
 
 
 def cotton_component(parser, token):
@@ -29,8 +75,18 @@ def cotton_component(parser, token):
 
     Usage:
         {% cotton_component 'template_path' 'component_key' key1="value1" :key2="dynamic_value" %}
+
+    With `only` ahead of the template path, compiled from the c-only attribute, the component only sees its attributes
+    and slots, not the context it's used in:
+        {% cotton_component only 'template_path' 'component_key' key1="value1" %}
     """
     bits = token.split_contents()
+
+    # Template paths always end with .html, so this can't be a component, nor an attribute named only
+    only = bits[1] == "only"
+    if only:
+        del bits[1]
+
     template_path = bits[1]
     component_key = bits[2]
 
@@ -48,84 +104,186 @@ def cotton_component(parser, token):
     nodelist = parser.parse(("end_cotton_component",))
     parser.delete_first_token()
 
-    return CottonComponentNode(nodelist, template_path, component_key, kwargs)
+    return CottonComponentNode(nodelist, template_path, component_key, kwargs, only)
+
+
+# How an attribute's value is found at render: it's either known at parse time, resolved from the context, or a python
+# literal that's evaluated afresh for each render as it may be mutable, i.e. a list or dict.
+STATIC_ATTRIBUTE = "static"
+VARIABLE_ATTRIBUTE = "variable"
+LITERAL_ATTRIBUTE = "literal"
+
+
+def compile_attribute(key, value):
+    """Work out at parse time how to find the attribute's value at render, returning (key, context key, kind, value,
+    fallback). Dynamic attributes (prefixed with ":") are template variables, falling back to python literals, or the
+    string as it is when they're neither."""
+    # strip single or double quotes only if both sides have them
+    if value and value[0] == value[-1] and value[0] in ('"', "'"):
+        value = value[1:-1]
+
+    is_dynamic = key.startswith(":")
+    if is_dynamic:
+        key = key[1:]
+
+    context_key = key.replace("-", "_")
+
+    # Boolean attribute
+    if value == "":
+        return key, context_key, STATIC_ATTRIBUTE, True, None
+
+    if not is_dynamic:
+        return key, context_key, STATIC_ATTRIBUTE, value, None
+
+    variable = template.Variable(value)
+
+    # Numbers and quoted strings resolve to the same value every time, translated strings don't
+    if variable.lookups is None and not variable.translate:
+        return key, context_key, STATIC_ATTRIBUTE, variable.literal, None
+
+    if variable.lookups is not None:
+        try:
+            expression = ast.parse(value.lstrip(" \t"), mode="eval")
+            literal = ast.literal_eval(expression)
+        except (ValueError, SyntaxError):
+            pass
+        else:
+            try:
+                hash(literal)
+            except TypeError:
+                return key, context_key, LITERAL_ATTRIBUTE, expression, None
+
+            return key, context_key, STATIC_ATTRIBUTE, literal, None
+
+    return key, context_key, VARIABLE_ATTRIBUTE, variable, value
+
+
+def split_static_attrs(attrs):
+    """Gather the static attributes that come before any others, so their part of the component's attrs is worked out
+    once, at parse time. Returns the attrs dict and context for them, their attrs string, and the attributes left to
+    resolve at render. The attrs keep the order they're given in, so a static attribute after a dynamic one is left
+    to render, as is everything when a dynamic attribute would replace a static one's value."""
+    static_count = 0
+    while static_count < len(attrs) and attrs[static_count][2] == STATIC_ATTRIBUTE:
+        static_count += 1
+
+    static_attrs = {key: value for key, _, _, value, _ in attrs[:static_count]}
+    dynamic_attrs = attrs[static_count:]
+
+    if any(key in static_attrs for key, *_ in dynamic_attrs):
+        static_attrs, static_count, dynamic_attrs = {}, 0, attrs
+
+    static_context_attrs = {
+        context_key: value for _, context_key, _, value, _ in attrs[:static_count]
+    }
+    static_attrs_string = " ".join(
+        f"{key}={ensure_quoted(value)}" for key, value in static_attrs.items()
+    )
+
+    return static_attrs, static_context_attrs, static_attrs_string, dynamic_attrs
 
 
 class CottonComponentNode(Node):
-    def __init__(self, nodelist, template_path, component_key, kwargs):
+    def __init__(self, nodelist, template_path, component_key, kwargs, only=False):
         self.nodelist = nodelist
         self.template_path = template_path
         self.component_key = component_key
         self.kwargs = kwargs
+        self.attrs = [compile_attribute(key, value) for key, value in kwargs.items()]
+        (
+            self.static_attrs,
+            self.static_context_attrs,
+            self.static_attrs_string,
+            self.dynamic_attrs,
+        ) = split_static_attrs(self.attrs)
+        self.only = only
+        self.component_template = None
+
+    def __getstate__(self):
+        # The resolved template belongs to the process that rendered the node
+        return {**self.__dict__, "component_template": None}
 
     def render(self, context):
-        attrs = self._build_attrs(context)
+        # Attributes by name, and by the name they're given in the component's context, i.e. 'x-init' is {{ x_init }}.
+        # Those known at parse time come first and were gathered then, so only the rest are added here.
+        attrs = self.static_attrs.copy()
+        context_attrs = {}
+
+        for key, context_key, kind, value, fallback in self.dynamic_attrs:
+            if kind == VARIABLE_ATTRIBUTE:
+                try:
+                    value = value.resolve(context)
+                except template.VariableDoesNotExist:
+                    value = fallback
+            elif kind == LITERAL_ATTRIBUTE:
+                value = ast.literal_eval(value)
+
+            attrs[key] = value
+            context_attrs[context_key] = value
 
         # Add the remainder as the default slot
-        local_ctx = context.flatten()
-        local_ctx["slot"] = self.nodelist.render(context)
+        local_ctx = {"slot": self.nodelist.render(context)}
 
         # Merge slots and attributes into the local context
         all_named_slots_ctx = context.get("cotton_named_slots", {})
         local_named_slots_ctx = all_named_slots_ctx.get(self.component_key, {})
         local_ctx.update(local_named_slots_ctx)
 
+        # The static attributes are first in attrs, as they're added first and never overridden by the rest
+        static_count = len(self.static_attrs)
+
         # We need to check if any dynamic attributes are present in the component slots and move them over to attrs
         if "ctn_template_expression_attrs" in local_named_slots_ctx:
             for expression_attr in local_named_slots_ctx["ctn_template_expression_attrs"]:
+                if expression_attr in self.static_attrs:
+                    # It replaces a static attribute's value, so the whole string is built again
+                    static_count = 0
+
                 attrs[expression_attr] = local_named_slots_ctx[expression_attr]
+                context_attrs[expression_attr.replace("-", "_")] = attrs[expression_attr]
 
-        # Build attrs string before formatting any '-' to '_' in attr names
-        attrs_string = " ".join(f"{key}={ensure_quoted(value)}" for key, value in attrs.items())
-        local_ctx["attrs"] = mark_safe(attrs_string)
+        # The attrs string is built from the attrs before formatting any '-' to '_' in attr names, reusing the static ones
+        local_ctx["attrs"] = Attrs(attrs, self.static_attrs_string, static_count)
         local_ctx["attrs_dict"] = attrs
 
-        # Store attr names in a callable format, i.e. 'x-init' will be accessible by {{ x_init }}
-        attrs = {key.replace("-", "_"): value for key, value in attrs.items()}
-        local_ctx.update(attrs)
+        local_ctx.update(self.static_context_attrs)
+        local_ctx.update(context_attrs)
 
         # Reset the component's slots in context to prevent data leaking between components
         all_named_slots_ctx[self.component_key] = {}
 
-        return render_template(self.template_path, local_ctx)
-
-    def _build_attrs(self, context):
-        """
-        Build the attributes dictionary for the component
-        """
-        attrs = {}
-
-        for key, value in self.kwargs.items():
-            # strip single or double quotes only if both sides have them
-            if value and value[0] == value[-1] and value[0] in ('"', "'"):
-                value = value[1:-1]
-
-            if key.startswith(":"):
-                key = key[1:]
-                attrs[key] = self._process_dynamic_attribute(value, context)
-            elif value == "":
-                attrs[key] = True
-            else:
-                attrs[key] = value
-
-        return attrs
-
-    def _process_dynamic_attribute(self, value, context):
-        """
-        Process a dynamic attribute (prefixed with ":")
-        """
-        # Template variable
+        # Render on top of the parent's context rather than a copy of it, or with `only`, on top of just the builtins
+        # (True, False and None). The component may leave frames of its own on the context (i.e. the vars frame's), so
+        # the parent's frames are put back as they were afterwards.
+        parent_dicts = context.dicts
+        parent_settings = context.autoescape, context.use_l10n, context.use_tz
+        context.dicts = parent_dicts[:1] if self.only else parent_dicts[:]
+        context.update(local_ctx)
+
         try:
-            return template.Variable(value).resolve(context)
-        except template.VariableDoesNotExist:
-            pass
+            component_template = self.get_template(context)
+            # The component renders as it would on its own, not as the block it's in, i.e. {% autoescape off %}
+            context.autoescape = component_template.engine.autoescape
+            context.use_l10n = None
+            context.use_tz = None
 
-        # Boolean attribute
-        if value == "":
-            return True
+            return component_template.render(context)
+        finally:
+            context.dicts = parent_dicts
+            context.autoescape, context.use_l10n, context.use_tz = parent_settings
 
-        # String literal
-        try:
-            return ast.literal_eval(value)
-        except (ValueError, SyntaxError):
-            return value
+    def get_template(self, context):
+        """The component's template is resolved on first render and held by the node from then on, for as long as it's
+        current and the node is rendered by the same engine."""
+        engine = context.template.engine if context.template is not None else Engine.get_default()
+        component_template = self.component_template
+
+        if (
+            component_template is None
+            or component_template.engine is not engine
+            or not component_template.is_current()
+        ):
+            component_template = get_component_template(self.template_path, engine)
+            self.component_template = component_template
+
+        return component_template.template
@@ -1,7 +1,6 @@
 from django import template
-from django.utils.safestring import mark_safe
 
-from django_cotton.utils import ensure_quoted
+from django_cotton.utils import Attrs
 
 register = template.Library()
 
@@ -50,10 +49,7 @@ class CottonVarsFrameNode(template.Node):
         attrs_without_vars = {k: v for k, v in component_attrs.items() if k not in vars}
 
         # Provide all of the attrs as a string to pass to the component before any '-' to '_' replacing
-        attrs = " ".join(
-            f"{k}={ensure_quoted(v)}" for k, v in attrs_without_vars.items()
-        )
-        context["attrs"] = mark_safe(attrs)
+        context["attrs"] = Attrs(attrs_without_vars)
 
         context["attrs_dict"] = attrs_without_vars
 
@@ -4,7 +4,7 @@ from django.utils.html import format_html_join
 from django_cotton.templatetags._component import cotton_component
 from django_cotton.templatetags._slot import cotton_slot
 from django_cotton.templatetags._vars_frame import cotton_vars_frame
-from django_cotton.utils import eval_string
+from django_cotton.utils import Attrs, eval_string
 
 register = template.Library()
 register.tag("cotton_component", cotton_component)
@@ -14,8 +14,10 @@ register.tag("cotton_vars_frame", cotton_vars_frame)
 
 @register.filter
 def merge(attrs, args):
-    # attrs is expected to be a dictionary of existing attributes
+    # attrs is expected to be a dictionary of existing attributes, or the {{ attrs }} built from one
     # args is a string of additional attributes to merge, e.g., "class:extra-class"
+    if isinstance(attrs, Attrs):
+        attrs = attrs.attrs
     for arg in args.split(","):
         key, value = arg.split(":", 1)
         if key in attrs:
@@ -3,13 +3,14 @@ import sys
 import shutil
 import tempfile
 
-from django.core.cache import cache
 from django.urls import path
 from django.test import override_settings
 from django.views.generic import TemplateView
 from django.conf import settings
 from django.test import TestCase
 
+from django_cotton.cotton_loader import invalidate_cotton_cache
+
 
 class DynamicURLModule:
     def __init__(self):
@@ -48,7 +49,7 @@ class CottonInlineTestCase(TestCase):
 
     def tearDown(self):
         """Clear cache between tests so that we can use the same file names for simplicity"""
-        cache.clear()
+        invalidate_cotton_cache()
 
     def create_template(self, name, content, url=None):
         """Create a template file in the temporary directory and return the path"""
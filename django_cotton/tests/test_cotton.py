@@ -1,6 +1,54 @@
-from django.test import TestCase
-
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.management import CommandError, call_command
+from django.template import Context, Engine, Origin, TemplateDoesNotExist, engines
+from django.test import RequestFactory, TestCase
+from django.utils.html import conditional_escape
+from django.utils.safestring import SafeString, mark_safe
+
+from django_cotton.bs4_compiler import CottonCompiler
+from django_cotton.build import compile_templates
+from django_cotton.cotton_loader import (
+    COMPRESSION_CODECS,
+    CacheGeneration,
+    CottonTemplateCacheHandler,
+    cache_generation,
+    get_compiled_hash,
+    get_compiler,
+    invalidate_cotton_cache,
+)
+from django_cotton.cotton_loader import Loader as CottonLoader
+from django_cotton.lru_cache import LRUCache
+from django_cotton.nodelist_cache import PreparsedTemplate
+from django_cotton.stats import get_stats, reset_stats, stats, stats_view
+from django_cotton.templatetags._component import (
+    LITERAL_ATTRIBUTE,
+    ComponentTemplate,
+    STATIC_ATTRIBUTE,
+    VARIABLE_ATTRIBUTE,
+    compile_attribute,
+    component_templates,
+)
+from django_cotton.template_watcher import InotifyWatcher, get_template_watcher
 from django_cotton.tests.inline_test_case import CottonInlineTestCase
+from django_cotton.tokenizer_compiler import TokenizerCompiler
+from django_cotton.utils import Attrs
+from django_cotton.warm_up import get_cotton_loaders, is_server_process, warm_up
 from django_cotton.tests.utils import get_compiled, get_rendered
 
 
@@ -23,6 +71,302 @@ class InlineTestCase(CottonInlineTestCase):
             self.assertContains(response, '<div class="i-am-component">')
             self.assertContains(response, "Hello, World!")
 
+    def test_components_see_the_parent_context_without_leaking_into_it(self):
+        self.create_template(
+            "cotton/layered.html",
+            """<c-vars size="lg" /><span {{ attrs }}>{{ name }}|{{ size }}|{{ request.path }}|{{ slot }}</span>""",
+        )
+
+        self.create_template(
+            "layered_view.html",
+            """{% with name="outer" %}<c-layered class="a" size="sm">one</c-layered><c-layered>two</c-layered>
+            {{ name }}|{{ size }}|{{ attrs }}|{{ slot }}{% endwith %}""",
+            "view/",
+        )
+
+        with self.settings(ROOT_URLCONF=self.get_url_conf()):
+            response = self.client.get("/view/")
+
+            self.assertContains(response, '<span class="a">outer|sm|/view/|one</span>')
+            self.assertContains(response, "<span >outer|lg|/view/|two</span>")
+            self.assertContains(response, "outer|||")
+
+    def test_components_with_only_dont_see_the_parent_context(self):
+        self.create_template(
+            "cotton/isolated.html",
+            """<c-vars size="lg" /><span {{ attrs }}>{{ name }}|{{ size }}|{{ title }}|{{ slot }}</span>""",
+        )
+
+        self.create_template(
+            "isolated_view.html",
+            """{% with name="outer" %}<c-isolated c-only class="a">
+            <c-slot name="title">{{ name }}</c-slot>one</c-isolated><c-isolated only="x" />{% endwith %}""",
+            "view/",
+        )
+
+        with self.settings(ROOT_URLCONF=self.get_url_conf()):
+            response = self.client.get("/view/")
+
+            self.assertContains(response, '<span class="a">|lg|outer|')
+            # only is an attribute like any other
+            self.assertContains(response, '<span only="x">outer|lg||</span>')
+
+        for compiler in (CottonCompiler(), TokenizerCompiler()):
+            self.assertEquals(
+                compiler.process("""<c-isolated c-only only="x" />""", "test_key"),
+                """{% cotton_component only cotton/isolated.html isolated  only="x" %}"""
+                """{% end_cotton_component %}""",
+            )
+
+    def test_components_are_escaped_inside_autoescape_off(self):
+        self.create_template("cotton/escaped.html", """<b>{{ x }}</b>""")
+        self.create_template(
+            "escaped_view.html",
+            """{% autoescape off %}<c-escaped :x="v" />{{ v }}{% endautoescape %}<c-escaped :x="v" />""",
+        )
+
+        template = engines["django"].engine.get_template("escaped_view.html")
+        rendered = template.render(Context({"v": "<i>"}))
+
+        self.assertEquals(rendered, "<b>&lt;i&gt;</b><i><b>&lt;i&gt;</b>")
+
+    def test_component_templates_are_resolved_once_per_node(self):
+        self.create_template("cotton/bound.html", """<b>{{ slot }}</b>""")
+        self.create_template("bound_view.html", """<c-bound>one</c-bound>""")
+        engine = engines["django"].engine
+        template = engine.get_template("bound_view.html")
+        node = template.nodelist[0]
+
+        self.assertEquals(template.render(Context()), "<b>one</b>")
+        component_template = node.component_template
+
+        self.assertEquals(template.render(Context()), "<b>one</b>")
+        self.assertIs(node.component_template, component_template)
+        self.assertIs(component_templates.get((engine, "cotton/bound.html")), component_template)
+
+    def test_component_templates_are_reloaded_when_changed(self):
+        path = self.create_template("cotton/changing.html", """<b>{{ slot }}</b>""")
+        self.create_template("changing_view.html", """<c-changing>one</c-changing>""", "view/")
+
+        with self.settings(ROOT_URLCONF=self.get_url_conf(), DEBUG=False):
+            self.assertContains(self.client.get("/view/"), "<b>one</b>")
+
+            self.create_template("cotton/changing.html", """<i>{{ slot }}</i>""")
+            mtime = os.path.getmtime(path) + 1
+            os.utime(path, (mtime, mtime))
+
+            # Without the autoreloader, and though the view is held by the engine's cached loader
+            self.assertContains(self.client.get("/view/"), "<i>one</i>")
+
+    def test_attributes_are_resolved_for_each_render(self):
+        self.create_template(
+            "cotton/resolved.html",
+            """<b>{{ number }}|{{ list|length }}|{{ label }}</b>""",
+        )
+        self.create_template(
+            "resolved_view.html",
+            """{% for item in items %}<c-resolved :number="item" :list="[1, 2]" :label="missing" />{% endfor %}""",
+        )
+
+        template = engines["django"].engine.get_template("resolved_view.html")
+        rendered = template.render(Context({"items": [1, 2]}))
+
+        self.assertEquals(rendered, "<b>1|2|missing</b><b>2|2|missing</b>")
+
+    def test_static_attributes_are_gathered_at_parse_time(self):
+        self.create_template(
+            "cotton/gathered.html",
+            """<b {{ attrs }}>{{ attrs_dict|length }}|{{ x_b }}</b>""",
+        )
+        self.create_template(
+            "gathered_view.html",
+            """<c-gathered class="a" x-b="1" :n="n" id="c" /><c-gathered class="a" x-b="{{ n }}" />"""
+            """<c-gathered class="a" :class="n" />""",
+        )
+        template = engines["django"].engine.get_template("gathered_view.html")
+
+        self.assertEquals(
+            template.render(Context({"n": 2})),
+            """<b class="a" x-b="1" n="2" id="c">4|1</b><b class="a" x-b="2">2|2</b><b class="2">1|</b>""",
+        )
+        self.assertEquals(template.nodelist[0].static_attrs_string, 'class="a" x-b="1"')
+        self.assertEquals([attr[0] for attr in template.nodelist[0].dynamic_attrs], ["n", "id"])
+        self.assertEquals(template.nodelist[2].static_attrs, {})
+
+    def test_attrs_are_built_from_the_static_attrs_string(self):
+        self.create_template(
+            "cotton/attrs_string.html",
+            """{% if attrs %}<b {{ attrs }}>{{ attrs|merge:'class:x' }}|{{ attrs_dict|merge:'id:y' }}</b>{% endif %}""",
+        )
+        self.create_template(
+            "cotton/attrs_string_vars.html",
+            """<c-vars size="lg" /><i {{ attrs }}>{{ attrs|length }}</i>""",
+        )
+        self.create_template(
+            "attrs_string_view.html",
+            """<c-attrs-string class="a" :n="n" /><c-attrs-string />"""
+            """<c-attrs-string-vars size="sm" class="a" />""",
+        )
+
+        template = engines["django"].engine.get_template("attrs_string_view.html")
+        rendered = template.render(Context({"n": 2}))
+
+        # merge changes the attrs_dict that {{ attrs }} was built from, as it always has
+        self.assertEquals(
+            rendered,
+            """<b class="a" n="2">class="x a" n="2"|class="x a" n="2" id="y"</b><i class="a">9</i>""",
+        )
+
+        attrs = Attrs({"class": "a", "disabled": True}, 'class="b"', 1)
+        self.assertEquals(conditional_escape(attrs), 'class="b" disabled="True"')
+        self.assertIsInstance(attrs, SafeString)
+        self.assertEquals(Attrs({"class": "a"}, 'class="b"', 1), 'class="b"')
+        self.assertEquals(pickle.loads(pickle.dumps(attrs)), 'class="a" disabled="True"')
+
+    def test_attrs_can_be_serialized_as_json(self):
+        self.create_template(
+            "cotton/attrs_json.html",
+            """{{ attrs|json_script:"attrs" }}{% with data=attrs_dict %}{{ data|json_script }}{% endwith %}""",
+        )
+        self.create_template("attrs_json_view.html", """<c-attrs-json class="a" :n="n" />""")
+
+        template = engines["django"].engine.get_template("attrs_json_view.html")
+        rendered = template.render(Context({"n": 2}))
+
+        attrs_json = json.dumps('class="a" n="2"')
+        self.assertIn(f'<script id="attrs" type="application/json">{attrs_json}</script>', rendered)
+        self.assertIn(json.dumps({"class": "a", "n": 2}), rendered)
+
+    def test_attrs_can_be_used_as_a_string(self):
+        filters = "|".join(
+            [
+                "{{ attrs|first }}",
+                "{{ attrs|last }}",
+                '{{ attrs|slice:":3" }}',
+                '{{ attrs|join:"," }}',
+                "{{ attrs|length }}",
+                "{{ attrs|upper }}",
+                "{{ attrs|truncatechars:5 }}",
+                "{{ attrs|wordcount }}",
+                """{{ attrs|cut:'"' }}""",
+                "{{ attrs|escape }}",
+                '{{ attrs|add:"!" }}',
+                "{{ attrs|random|length }}",
+            ]
+        )
+        self.create_template("cotton/filtered.html", filters)
+        self.create_template("filtered_view.html", """<c-filtered class="a b" :n="n" />""")
+
+        engine = engines["django"].engine
+        rendered = engine.get_template("filtered_view.html").render(Context({"n": 2}))
+        expected = engine.from_string(filters).render(
+            Context({"attrs": mark_safe('class="a b" n="2"')})
+        )
+
+        self.assertEquals(rendered, expected)
+
+    def test_parsed_nodelists_can_be_cached(self):
+        self.create_template("cotton/preparsed.html", """<b {{ attrs }}>{{ slot }}</b>""")
+        self.create_template(
+            "preparsed_view.html",
+            """{% load i18n %}<c-preparsed class="a" :n="n">{% if n > 1 or not n %}many{% endif %}"""
+            """{% trans "hi" %}</c-preparsed>""",
+        )
+
+        with self.settings(COTTON_NODELIST_CACHE_ENABLED=True):
+            loader = CottonLoader(engines["django"].engine)
+            parsed = loader.get_template("preparsed_view.html")
+            preparsed = loader.get_template("preparsed_view.html")
+
+        self.assertNotIsInstance(parsed, PreparsedTemplate)
+        self.assertIsInstance(preparsed, PreparsedTemplate)
+        self.assertIs(preparsed.nodelist[1].origin, preparsed.origin)
+
+        for n in (0, 1, 2):
+            with self.subTest(n=n):
+                self.assertEquals(
+                    preparsed.render(Context({"n": n})), parsed.render(Context({"n": n}))
+                )
+
+    def test_static_components_can_be_inlined(self):
+        self.create_template(
+            "cotton/inlined.html",
+            """<b {{ attrs }}>{{ label }}|{{ x_data }}|{{ disabled }}|{{ slot }}</b>""",
+        )
+        self.create_template(
+            "inlined_view.html",
+            """<c-inlined class="a b" label="hi" x-data="{open: true}" disabled />"""
+            """<c-inlined :label="label" /><c-inlined>{{ label }}</c-inlined>""",
+        )
+        self.create_template(
+            "inlined_autoescape_view.html",
+            """{% autoescape off %}<c-inlined label="hi" />{% endautoescape %}""",
+        )
+        engine = engines["django"].engine
+        context = {"label": "<i>"}
+
+        rendered = CottonLoader(engine).get_template("inlined_view.html").render(Context(context))
+        invalidate_cotton_cache()
+
+        with self.settings(COTTON_INLINE_COMPONENTS=True):
+            loader = CottonLoader(engine)
+            template = loader.get_template("inlined_view.html")
+
+        self.assertEquals(template.source.count("{% cotton_component "), 2)
+        self.assertEquals(template.render(Context(context)), rendered)
+        self.assertIn(
+            "{% cotton_component ", loader.get_template("inlined_autoescape_view.html").source
+        )
+
+    def test_parents_are_recompiled_when_an_inlined_component_changes(self):
+        path = self.create_template("cotton/inlined_child.html", """<b>{{ label }}</b>""")
+        self.create_template("inlined_parent.html", """<c-inlined-child label="hi" />""")
+
+        with self.settings(COTTON_INLINE_COMPONENTS=True):
+            loader = CottonLoader(engines["django"].engine)
+            template = loader.get_template("inlined_parent.html")
+            self.assertNotIn("{% cotton_component ", template.source)
+            self.assertEquals(template.render(Context()), "<b>hi</b>")
+
+            self.create_template("cotton/inlined_child.html", """<i>{{ label }}</i>""")
+            mtime = os.path.getmtime(path) + 1
+            os.utime(path, (mtime, mtime))
+
+            template = loader.get_template("inlined_parent.html")
+            self.assertEquals(template.render(Context()), "<i>hi</i>")
+
+    def test_inlined_components_are_recorded_outside_the_compiled_template(self):
+        self.create_template("cotton/inlined_leaf.html", """<b>{{ label }}</b>""")
+        self.create_template("cotton/inlined_branch.html", """<c-inlined-leaf label="hi" />""")
+        self.create_template(
+            "cotton/relative_include.html", """{% include "./inlined_leaf.html" %}"""
+        )
+        self.create_template(
+            "inlined_tree.html", """<c-inlined-branch /><c-relative-include label="x" />"""
+        )
+        engine = engines["django"].engine
+
+        with self.settings(COTTON_INLINE_COMPONENTS=True):
+            loader = CottonLoader(engine)
+            compiled = loader.get_template("inlined_tree.html").source
+            invalidate_cotton_cache()
+            compiled_again = CottonLoader(engine).get_template("inlined_tree.html").source
+
+        self.assertEquals(compiled, compiled_again)
+        self.assertNotIn("{% cotton_component cotton/inlined_", compiled)
+        self.assertIn("{% cotton_component cotton/relative_include.html ", compiled)
+
+        origin = next(loader.get_template_sources("inlined_tree.html"))
+        cached = loader.cache_handler.get_cached_template(
+            loader.cache_handler.get_cache_key(origin.template_name, os.path.getmtime(origin.name))
+        )
+        self.assertEquals(
+            set(cached.dependencies), {"cotton/inlined_branch.html", "cotton/inlined_leaf.html"}
+        )
+        decoded = loader.cache_handler._decode(loader.cache_handler._encode(cached))
+        self.assertEquals(decoded, cached)
+        self.assertEquals(decoded.dependencies, cached.dependencies)
+
     def test_new_lines_in_attributes_are_preserved(self):
         self.create_template(
             "cotton/preserved.html",
@@ -207,6 +551,36 @@ class InlineTestCase(CottonInlineTestCase):
 
             self.assertContains(response, "some_attribute__something")
 
+    def test_templates_without_cotton_syntax_are_only_read_once(self):
+        path = self.create_template("plain.html", "<p>{{ x }}</p>")
+        loader = CottonLoader(engines["django"].engine)
+        origin = next(loader.get_template_sources("plain.html"))
+
+        reads = []
+        read = loader._get_template_string
+        loader._get_template_string = lambda name: reads.append(name) or read(name)
+
+        for _ in range(2):
+            with self.assertRaises(TemplateDoesNotExist):
+                loader.get_contents(origin)
+        self.assertEquals(len(reads), 1)
+
+        # A changed file is checked again
+        os.utime(path, (0, 0))
+        with self.assertRaises(TemplateDoesNotExist):
+            loader.get_contents(origin)
+        self.assertEquals(len(reads), 2)
+
+    def test_plain_templates_can_be_served_by_the_cotton_loader(self):
+        self.create_template("plain.html", "<p>{{ x }}</p>")
+
+        with self.settings(COTTON_SERVE_PLAIN_TEMPLATES=True):
+            loader = CottonLoader(engines["django"].engine)
+            origin = next(loader.get_template_sources("plain.html"))
+
+            self.assertEquals(loader.get_contents(origin), "<p>{{ x }}</p>")
+            self.assertEquals(loader.get_contents(origin), "<p>{{ x }}</p>")
+
 
 class CottonTestCase(TestCase):
     def test_parent_component_is_rendered(self):
@@ -264,6 +638,30 @@ class CottonTestCase(TestCase):
             """<a href="#" class="test" class="test2">hello</a>""",
         )
 
+    def test_same_source_compiles_to_the_same_output(self):
+        template = """<c-comp class="a" class="b"><a {% if x %} href="1" {% else %} href="2" {% endif %} href="3">hi</a></c-comp>"""
+
+        compiled = CottonCompiler().process(template, "test_key")
+
+        self.assertEquals(compiled, CottonCompiler().process(template, "test_key"))
+        self.assertNotIn("__COTTON_DUPE_ATTR__", compiled)
+
+    def test_compiled_hash_is_set_on_the_origin(self):
+        loader = CottonLoader(engines["django"].engine)
+        origin = next(loader.get_template_sources("parent_test.html"))
+
+        compiled = loader.get_contents(origin)
+        self.assertEquals(origin.compiled_hash, get_compiled_hash(compiled))
+
+        # Served from the cache, which keeps the hash with the template instead of hashing it again
+        origin = next(loader.get_template_sources("parent_test.html"))
+        with mock.patch("django_cotton.cotton_loader.get_compiled_hash") as get_hash:
+            loader.get_contents(origin)
+            loader.get_contents(origin)
+
+        get_hash.assert_not_called()
+        self.assertEquals(origin.compiled_hash, get_compiled_hash(compiled))
+
     def test_attrs_do_not_contain_vars(self):
         response = self.client.get("/vars-test")
         self.assertContains(response, "attr1: 'im an attr'")
@@ -325,6 +723,37 @@ class CottonTestCase(TestCase):
         self.assertContains(response, "dict.key is 'value'")
         self.assertContains(response, "listdict.0.key is 'value'")
 
+    def test_attributes_are_classified_at_parse_time(self):
+        kinds = {
+            key: kind
+            for key, context_key, kind, value, fallback in (
+                compile_attribute(key, value)
+                for key, value in {
+                    "label": '"Hello"',
+                    "disabled": "",
+                    ":count": '"1"',
+                    ":flag": '"True"',
+                    ":items": '"[1, 2]"',
+                    ":user": '"request.user"',
+                    ":title": "\"_('Title')\"",
+                }.items()
+            )
+        }
+
+        self.assertEquals(
+            kinds,
+            {
+                "label": STATIC_ATTRIBUTE,
+                "disabled": STATIC_ATTRIBUTE,
+                "count": STATIC_ATTRIBUTE,
+                "flag": STATIC_ATTRIBUTE,
+                "items": LITERAL_ATTRIBUTE,
+                "user": VARIABLE_ATTRIBUTE,
+                "title": VARIABLE_ATTRIBUTE,
+            },
+        )
+        self.assertEquals(compile_attribute("x-data", '"{}"')[1], "x_data")
+
     def test_cvars_can_be_converted_to_python_types(self):
         response = self.client.get("/test/eval-vars")
 
@@ -356,6 +785,78 @@ class CottonTestCase(TestCase):
             """My template was not specified in settings!""",
         )
 
+    def test_loader_dirs_are_only_looked_up_once(self):
+        engine = engines["django"].engine
+        engine_dirs = list(engine.dirs)
+        loader = CottonLoader(engine)
+
+        dirs = loader.get_dirs()
+
+        self.assertIs(loader.get_dirs(), dirs)
+        self.assertEquals(engine.dirs, engine_dirs)
+        self.assertEquals(len(dirs), len(set(dirs)))
+
+    def test_bs4_is_only_imported_to_compile(self):
+        script = (
+            "import sys, django; from django.conf import settings; settings.configure(); django.setup(); "
+            "import django_cotton.cotton_loader as loader; print('bs4' in sys.modules); "
+            "loader.get_compiler().process('<c-foo />', 'foo'); print('bs4' in sys.modules)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, check=True, text=True
+        ).stdout
+
+        self.assertEquals(output.split(), ["False", "True"])
+
+    def test_template_watcher_is_only_imported_to_watch(self):
+        script = (
+            "import sys, django; from django.conf import settings; settings.configure(); django.setup(); "
+            "import django_cotton.cotton_loader; print('django_cotton.template_watcher' in sys.modules)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, check=True, text=True
+        ).stdout
+
+        self.assertEquals(output.split(), ["False"])
+
+    def test_template_index_maps_names_to_paths(self):
+        with self.settings(COTTON_TEMPLATE_INDEX_ENABLED=True):
+            loader = CottonLoader(engines["django"].engine)
+
+            origins = list(loader.get_template_sources("unspecified_view.html"))
+
+            self.assertEquals(
+                origins[0].name,
+                os.path.abspath("unspecified_app_directory/templates/unspecified_view.html"),
+            )
+            # The other directories follow, without the indexed template again
+            self.assertEquals(len(origins), len(loader.get_dirs()))
+            self.assertNotIn(origins[0].name, [origin.name for origin in origins[1:]])
+
+            # Unknown templates are still looked for in each directory
+            self.assertEquals(
+                len(list(loader.get_template_sources("missing.html"))), len(loader.get_dirs())
+            )
+
+    def test_indexed_templates_can_extend_the_same_name(self):
+        first_dir, second_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, first_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, second_dir, ignore_errors=True)
+
+        with open(os.path.join(first_dir, "layout.html"), "w") as f:
+            f.write('{% extends "layout.html" %}{% block title %}Override{% endblock %}')
+        with open(os.path.join(second_dir, "layout.html"), "w") as f:
+            f.write("<title>{% block title %}Base{% endblock %}</title>")
+
+        with self.settings(COTTON_TEMPLATE_INDEX_ENABLED=True, COTTON_SERVE_PLAIN_TEMPLATES=True):
+            engine = Engine(
+                dirs=[first_dir, second_dir], loaders=["django_cotton.cotton_loader.Loader"]
+            )
+
+            self.assertEquals(
+                engine.get_template("layout.html").render(Context()), "<title>Override</title>"
+            )
+
     def test_expression_tags_close_to_tag_elements_doesnt_corrupt_the_tag(self):
         html = """
             <div{% if 1 = 1 %} attr1="variable" {% endif %}></div>
@@ -365,3 +866,604 @@ class CottonTestCase(TestCase):
 
         self.assertFalse("</div{% if 1 = 1 %}>" in rendered, "Tag corrupted")
         self.assertTrue("</div>" in rendered, "</div> not found in rendered string")
+
+    def test_django_syntax_is_restored_verbatim(self):
+        compiled = get_compiled(
+            """<c-comp label="{{ a|cut:"\\n" }}">{{ a }} {% firstof a "\\1" %}\n{{ b }}</c-comp>"""
+        )
+
+        self.assertEquals(
+            compiled,
+            """{% cotton_component cotton/comp.html comp  %}{% cotton_slot label comp expression_attr %}{{ a|cut:"\\n" }}{% end_cotton_slot %}{{ a }} {% firstof a "\\1" %} {{ b }}{% end_cotton_component %}""",
+        )
+
+    def test_nested_content_is_compiled_in_place(self):
+        compiled = get_compiled(
+            """<c-outer><c-inner><span title="b" class="a"></span><c-slot name="s"><!-- note --><c-leaf /></c-slot></c-inner></c-outer>"""
+        )
+
+        self.assertEquals(
+            compiled,
+            """{% cotton_component cotton/outer.html outer  %}{% cotton_component cotton/inner.html inner  %}<span title="b" class="a"></span>{% cotton_slot s inner %}<!-- note -->{% cotton_component cotton/leaf.html leaf  %}{% end_cotton_component %}{% end_cotton_slot %}{% end_cotton_component %}{% end_cotton_component %}""",
+        )
+
+
+class TemplateCacheTestCase(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        self.assertEquals((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+        self.assertEquals((lru.hits, lru.misses), (3, 1))
+
+    def test_templates_are_served_from_l1_before_l2(self):
+        handler = CottonTemplateCacheHandler()
+        key = handler.get_cache_key("view.html", 1.0)
+        handler.cache_template(key, "compiled")
+
+        cache.delete(key)
+
+        self.assertEquals(handler.get_cached_template(key), "compiled")
+        self.assertEquals((handler.l1.hits, handler.l2_hits, handler.l2_misses), (1, 0, 0))
+
+        # A fresh process only has L2, and fills its L1 from it
+        handler.cache_template(key, "compiled")
+        handler = CottonTemplateCacheHandler()
+        self.assertEquals(handler.get_cached_template(key), "compiled")
+        self.assertIn(key, handler.l1)
+        self.assertEquals(handler.l2_hits, 1)
+
+        # A changed mtime is a different key
+        self.assertIsNone(handler.get_cached_template(handler.get_cache_key("view.html", 2.0)))
+
+    def test_l2_can_be_disabled(self):
+        with self.settings(COTTON_TEMPLATE_CACHE_L2_ENABLED=False):
+            handler = CottonTemplateCacheHandler()
+            key = handler.get_cache_key("view.html", 1.0)
+            handler.cache_template(key, "compiled")
+
+            self.assertEquals(handler.get_cached_template(key), "compiled")
+            self.assertIsNone(cache.get(key))
+
+    def test_invalidating_drops_all_compiled_templates_only(self):
+        handler = CottonTemplateCacheHandler()
+        key = handler.get_cache_key("view.html", 1.0)
+        handler.cache_template(key, "compiled")
+        cache.set("unrelated", "data")
+
+        call_command("cotton_clear_cache", stdout=StringIO())
+
+        new_key = handler.get_cache_key("view.html", 1.0)
+        self.assertNotEquals(new_key, key)
+        self.assertIsNone(handler.get_cached_template(new_key))
+        self.assertEquals(cache.get("unrelated"), "data")
+
+    def test_invalidating_is_seen_by_other_processes_after_the_ttl(self):
+        generation = cache_generation.get()
+        cache.set(cache_generation.cache_key, generation + 1)
+
+        with self.settings(COTTON_CACHE_GENERATION_TTL=0):
+            self.assertEquals(cache_generation.get(), generation + 1)
+
+        self.assertEquals(invalidate_cotton_cache(), generation + 2)
+
+    def test_components_check_the_generation_without_the_cache(self):
+        engine = engines["django"].engine
+        component_template = ComponentTemplate(engine.from_string("<b></b>"), engine)
+        cache.set(cache_generation.cache_key, cache_generation.get() + 1)
+
+        with self.settings(COTTON_CACHE_GENERATION_TTL=0):
+            self.assertTrue(component_template.is_current())
+            # Until templates are loaded again
+            cache_generation.get()
+            self.assertFalse(component_template.is_current())
+
+    def test_generation_is_kept_in_process_without_l2(self):
+        with self.settings(COTTON_TEMPLATE_CACHE_L2_ENABLED=False):
+            generation = CacheGeneration()
+            value = generation.get()
+
+            self.assertEquals(generation.bump(), value + 1)
+            self.assertIsNone(cache.get(CacheGeneration.cache_key))
+
+    def test_large_entries_can_be_compressed(self):
+        content = "<div>\n    {{ slot }}\n</div>\n" * 200
+
+        for codec in COMPRESSION_CODECS:
+            with self.subTest(codec=codec), self.settings(
+                COTTON_TEMPLATE_CACHE_COMPRESSION=codec, COTTON_TEMPLATE_CACHE_L1_SIZE=0
+            ):
+                handler = CottonTemplateCacheHandler()
+                key = handler.get_cache_key("view.html", 1.0)
+                small_key = handler.get_cache_key("small.html", 1.0)
+
+                handler.cache_template(key, content)
+                handler.cache_template(small_key, "<div></div>")
+
+                self.assertNotIsInstance(cache.get(key), str)
+                self.assertEquals(cache.get(small_key), "<div></div>")
+                self.assertEquals(handler.get_cached_template(key), content)
+                self.assertEquals(handler.get_cached_templates([key]), {key: content})
+                self.assertLess(handler.compression_ratio, 0.1)
+                self.assertEquals(handler.decode_count, 2)
+
+    def test_unknown_cache_envelopes_are_misses(self):
+        handler = CottonTemplateCacheHandler()
+        key = handler.get_cache_key("view.html", 1.0)
+        cache.set(key, ("cotton_compressed", 99, "zlib", b""))
+
+        self.assertIsNone(handler.get_cached_template(key))
+
+    def test_concurrent_misses_compile_once(self):
+        handler = CottonTemplateCacheHandler()
+        key = handler.get_cache_key("view.html", 1.0)
+        compiles = []
+
+        def compile_template():
+            compiles.append(1)
+            time.sleep(0.05)
+            return "compiled"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(lambda _: handler.compile_once(key, compile_template), range(8))
+            )
+
+        self.assertEquals(results, ["compiled"] * 8)
+        self.assertEquals(len(compiles), 1)
+
+    def test_processes_wait_for_the_one_holding_the_compile_lock(self):
+        with self.settings(COTTON_COMPILE_LOCK_ENABLED=True, COTTON_COMPILE_LOCK_WAIT=2):
+            handler = CottonTemplateCacheHandler()
+            key = handler.get_cache_key("view.html", 1.0)
+
+            # Another process holds the lock, and stores its result shortly
+            cache.add(f"{key}_lock", True)
+            threading.Timer(0.1, cache.set, (key, "compiled elsewhere")).start()
+
+            self.assertEquals(
+                handler.compile_once(key, lambda: "compiled here"), "compiled elsewhere"
+            )
+
+    def test_waiting_for_the_compile_lock_is_bounded(self):
+        with self.settings(COTTON_COMPILE_LOCK_ENABLED=True, COTTON_COMPILE_LOCK_WAIT=0.1):
+            handler = CottonTemplateCacheHandler()
+            key = handler.get_cache_key("view.html", 1.0)
+            cache.add(f"{key}_lock", True)
+
+            self.assertEquals(handler.compile_once(key, lambda: "compiled here"), "compiled here")
+            self.assertEquals(cache.get(key), "compiled here")
+
+    def test_warm_up_fills_the_caches(self):
+        loader = next(get_cotton_loaders(engines["django"].engine))
+        loader.cache_handler.l1.clear()
+        component_templates.clear()
+
+        path = dict(loader.get_template_files())["parent_test.html"]
+        cache_key = loader.cache_handler.get_cache_key("parent_test.html", os.path.getmtime(path))
+
+        compiled_count = warm_up(background=False)
+
+        self.assertGreater(compiled_count, 0)
+        self.assertIn(cache_key, loader.cache_handler.l1)
+        self.assertEquals(cache.get(cache_key), loader.cache_handler.l1.get(cache_key))
+        self.assertGreater(len(component_templates), 0)
+
+        # Templates already in the shared cache aren't compiled again
+        loader.cache_handler.l1.clear()
+        self.assertEquals(warm_up(background=False), 0)
+        self.assertIn(cache_key, loader.cache_handler.l1)
+
+    def test_only_server_processes_warm_up(self):
+        self.assertTrue(is_server_process(["gunicorn", "example_project.wsgi"]))
+        self.assertFalse(is_server_process(["manage.py", "migrate"]))
+        self.assertTrue(is_server_process(["manage.py", "runserver", "--noreload"]))
+
+        # runserver's autoreloader starts the server in a child process, with RUN_MAIN set
+        with mock.patch.dict(os.environ, {"RUN_MAIN": ""}):
+            self.assertFalse(is_server_process(["manage.py", "runserver"]))
+        with mock.patch.dict(os.environ, {"RUN_MAIN": "true"}):
+            self.assertTrue(is_server_process(["manage.py", "runserver"]))
+
+    def test_warm_up_can_run_in_the_background(self):
+        thread = warm_up()
+        thread.join(timeout=10)
+
+        self.assertFalse(thread.is_alive())
+
+    def test_stats_count_cache_hits_and_compiles(self):
+        loader = next(get_cotton_loaders(engines["django"].engine))
+        path = dict(loader.get_template_files())["parent_test.html"]
+        origin = Origin(path, "parent_test.html", loader)
+        invalidate_cotton_cache()
+        reset_stats()
+        stats.enabled = True
+
+        try:
+            loader.get_contents(origin)
+            loader.cache_handler.l1.clear()
+            loader.get_contents(origin)
+        finally:
+            stats.enabled = False
+
+        result = get_stats()
+
+        self.assertEquals(result["compile_count"], 1)
+        self.assertEquals(result["templates"]["parent_test.html"]["compile_count"], 1)
+        self.assertEquals(sum(result["compile_time_histogram"].values()), 1)
+        self.assertGreater(result["bytes_out"], 0)
+        self.assertEquals((result["l2"]["hits"], result["l2"]["misses"]), (1, 2))
+
+    def test_stats_command_loads_all_templates(self):
+        invalidate_cotton_cache()
+        reset_stats()
+        out = StringIO()
+
+        try:
+            call_command("cotton_stats", "--warm-up", "--json", stdout=out)
+        finally:
+            stats.enabled = False
+
+        result = json.loads(out.getvalue())
+        self.assertIn("parent_test.html", result["templates"])
+        self.assertEquals(result["compile_count"], len(result["templates"]))
+
+        with self.assertRaises(CommandError):
+            call_command("cotton_stats", stdout=StringIO())
+
+    def test_stats_view_reports_the_serving_process_to_staff(self):
+        request = RequestFactory().get("/cotton-stats/")
+        request.user = AnonymousUser()
+
+        with self.assertRaises(PermissionDenied):
+            stats_view(request)
+
+        request.user = User(is_staff=True)
+        self.assertEquals(json.loads(stats_view(request).content)["l1"], get_stats()["l1"])
+
+
+class TokenizerCompilerTestCase(TestCase):
+    templates_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+    def assertCompilersMatch(self, template_string):
+        self.assertEqual(
+            TokenizerCompiler().process(template_string, "test_key"),
+            CottonCompiler().process(template_string, "test_key"),
+        )
+
+    def test_compiler_is_selected_by_setting(self):
+        with self.settings(COTTON_COMPILER="bs4"):
+            self.assertIsInstance(get_compiler(), CottonCompiler)
+
+        with self.settings(COTTON_COMPILER="tokenizer"):
+            self.assertIsInstance(get_compiler(), TokenizerCompiler)
+
+    def test_output_matches_bs4_compiler_for_test_templates(self):
+        for root, dirs, files in os.walk(self.templates_dir):
+            for file in files:
+                with open(os.path.join(root, file)) as f:
+                    content = f.read()
+
+                with self.subTest(template=file):
+                    self.assertCompilersMatch(content)
+
+    def test_compilers_can_be_shared_between_threads(self):
+        templates = []
+        for root, dirs, files in os.walk(self.templates_dir):
+            for file in files:
+                with open(os.path.join(root, file)) as f:
+                    templates.append(f.read())
+
+        # Each template has its own number of django syntax placeholders, so mixing up calls garbles their output
+        templates += [
+            "<c-comp>"
+            + "{{ a%d }} <b>{%% if x %%}%d{%% endif %%}</b>" % (i, i) * (i % 7 + 1)
+            + "</c-comp>"
+            for i in range(300)
+        ]
+
+        for compiler in (CottonCompiler(), TokenizerCompiler()):
+            with self.subTest(compiler=type(compiler).__name__):
+                expected = [compiler.process(template, "test_key") for template in templates]
+
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    compiled = list(
+                        executor.map(
+                            lambda template: compiler.process(template, "test_key"), templates
+                        )
+                    )
+
+                self.assertEquals(compiled, expected)
+
+    def test_whitespace_around_django_syntax_matches_bs4_compiler(self):
+        templates = [
+            "<c-comp>{{ a }} {{ b }}</c-comp>",
+            "<c-comp>\n{% if x %}\n{{ a }}{% endif %} {{ b }}  {% endif %}\n</c-comp>",
+            "<div>\n    <c-comp />\n\n    <p>{{ a }}</p>\n</div>",
+            """<c-comp class=" a  {{ b }}" label="{% trans "Hi" %}" x={{ y }} y=" {{ a }} " />""",
+            '{% endif %} <c-vars a="{{ b }}" />\t<b>x</b>',
+            "<!DOCTYPE html>\n<html><c-comp /></html>",
+        ]
+
+        for template in templates:
+            with self.subTest(template=template):
+                self.assertCompilersMatch(template)
+
+    def test_cotton_tags_are_not_compiled_in_comments_or_scripts(self):
+        compiled = TokenizerCompiler().process(
+            "<!-- <c-comp /> --><script>if (a <c-b) {}</script><c-comp />", "test_key"
+        )
+
+        self.assertEqual(
+            compiled,
+            "<!-- <c-comp /> --><script>if (a <c-b) {}</script>"
+            "{% cotton_component cotton/comp.html comp  %}{% end_cotton_component %}",
+        )
+
+
+class BuildTestCase(TestCase):
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.build_dir, ignore_errors=True)
+
+    def test_cotton_templates_are_compiled_into_the_build_dir(self):
+        call_command("cotton_compile", build_dir=self.build_dir, stdout=StringIO())
+
+        with open(os.path.join(self.build_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        entry = manifest["templates"]["parent_test.html"]
+        template_dir = CottonLoader(engines["django"].engine).get_dirs()[entry["dir"]]
+        with open(os.path.join(template_dir, entry["source"])) as f:
+            source = f.read()
+        with open(os.path.join(self.build_dir, entry["compiled"])) as f:
+            compiled = f.read()
+
+        self.assertEquals(compiled, get_compiled(source))
+        self.assertEquals(entry["hash"], hashlib.sha256(source.encode()).hexdigest())
+        self.assertIn("cotton/eval_vars_test_component.html", manifest["templates"])
+        self.assertNotIn("cotton/receives_attributes.html", manifest["templates"])
+
+    def test_templates_can_be_compiled_in_parallel(self):
+        serial = compile_templates(os.path.join(self.build_dir, "serial"))
+        parallel = compile_templates(os.path.join(self.build_dir, "parallel"), workers=2)
+
+        self.assertEquals(parallel.manifest, serial.manifest)
+        self.assertEquals(parallel.errors, {})
+        self.assertEquals(parallel.timings.keys(), parallel.manifest["templates"].keys())
+
+    def test_only_changed_templates_are_recompiled(self):
+        templates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, templates_dir, ignore_errors=True)
+        loader = CottonLoader(engines["django"].engine, dirs=[templates_dir])
+
+        for name in ("a.html", "b.html"):
+            with open(os.path.join(templates_dir, name), "w") as f:
+                f.write("<c-comp />")
+
+        result = compile_templates(self.build_dir, loader)
+        self.assertIn("a.html", result.compiled)
+        self.assertIn("b.html", result.compiled)
+
+        with open(os.path.join(templates_dir, "b.html"), "w") as f:
+            f.write("<c-comp>changed</c-comp>")
+
+        result = compile_templates(self.build_dir, loader)
+        self.assertEquals(result.compiled, ["b.html"])
+        self.assertIn("a.html", result.skipped)
+        with open(os.path.join(self.build_dir, "b.html")) as f:
+            self.assertIn("changed", f.read())
+
+        # A build made with other settings (or an older compiler) is not reused
+        with self.settings(COTTON_DIR="components"):
+            result = compile_templates(self.build_dir, loader)
+            self.assertEquals(result.skipped, [])
+
+        result = compile_templates(self.build_dir, loader, force=True)
+        self.assertEquals(result.skipped, [])
+
+    def test_unreadable_templates_are_reported_as_errors(self):
+        templates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, templates_dir, ignore_errors=True)
+        loader = CottonLoader(engines["django"].engine, dirs=[templates_dir])
+
+        with open(os.path.join(templates_dir, "a.html"), "w") as f:
+            f.write("<c-comp />")
+        os.symlink(
+            os.path.join(templates_dir, "missing.html"), os.path.join(templates_dir, "b.html")
+        )
+
+        result = compile_templates(self.build_dir, loader)
+
+        self.assertIn("a.html", result.compiled)
+        self.assertEquals(list(result.errors), ["b.html"])
+        self.assertIn("FileNotFoundError", result.errors["b.html"])
+
+    def test_loader_serves_templates_from_the_build(self):
+        compile_templates(self.build_dir)
+
+        with self.settings(COTTON_SERVE_FROM_BUILD=True, COTTON_BUILD_DIR=self.build_dir):
+            loader = CottonLoader(engines["django"].engine)
+
+            origin = next(loader.get_template_sources("parent_test.html"))
+            with open(os.path.join(self.build_dir, "parent_test.html")) as f:
+                self.assertEquals(loader.get_contents(origin), f.read())
+
+            # Templates without cotton syntax are left to the next loader
+            origin = next(loader.get_template_sources("cotton/receives_attributes.html"))
+            with self.assertRaises(TemplateDoesNotExist):
+                loader.get_contents(origin)
+
+    def test_builds_can_be_served_from_another_path(self):
+        templates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, templates_dir, ignore_errors=True)
+        os.makedirs(os.path.join(templates_dir, "built"))
+        os.makedirs(os.path.join(templates_dir, "deployed"))
+        with open(os.path.join(templates_dir, "built", "view.html"), "w") as f:
+            f.write("<c-comp />")
+
+        engine = engines["django"].engine
+        compile_templates(self.build_dir, CottonLoader(engine, [f"{templates_dir}/built"]))
+        shutil.move(f"{templates_dir}/built/view.html", f"{templates_dir}/deployed/view.html")
+        with open(os.path.join(self.build_dir, "view.html"), "a") as f:
+            f.write("built")
+        with open(os.path.join(templates_dir, "deployed", "added.html"), "w") as f:
+            f.write("<c-comp />")
+
+        with self.settings(COTTON_SERVE_FROM_BUILD=True, COTTON_BUILD_DIR=self.build_dir):
+            loader = CottonLoader(engine, [f"{templates_dir}/deployed"])
+
+            origin = next(loader.get_template_sources("view.html"))
+            self.assertTrue(loader.get_contents(origin).endswith("built"))
+
+            # Templates added since the build are compiled when they're loaded
+            origin = next(loader.get_template_sources("added.html"))
+            self.assertEquals(loader.get_contents(origin), get_compiled("<c-comp />"))
+
+    def test_serving_from_the_build_requires_a_manifest(self):
+        with self.settings(COTTON_SERVE_FROM_BUILD=True, COTTON_BUILD_DIR=self.build_dir):
+            loader = CottonLoader(engines["django"].engine)
+            origin = next(loader.get_template_sources("parent_test.html"))
+
+            with self.assertRaises(ImproperlyConfigured):
+                loader.get_contents(origin)
+
+    def test_builds_made_with_other_settings_are_not_served(self):
+        compile_templates(self.build_dir)
+
+        with self.settings(
+            COTTON_SERVE_FROM_BUILD=True,
+            COTTON_BUILD_DIR=self.build_dir,
+            COTTON_INLINE_COMPONENTS=True,
+        ):
+            loader = CottonLoader(engines["django"].engine)
+            origin = next(loader.get_template_sources("parent_test.html"))
+
+            with self.assertRaises(ImproperlyConfigured):
+                loader.get_contents(origin)
+
+    def test_components_are_inlined_into_the_build(self):
+        templates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, templates_dir, ignore_errors=True)
+        os.makedirs(os.path.join(templates_dir, "cotton"))
+        component_path = os.path.join(templates_dir, "cotton", "comp.html")
+        with open(component_path, "w") as f:
+            f.write("<b>{{ label }}</b>")
+        with open(os.path.join(templates_dir, "view.html"), "w") as f:
+            f.write('<c-comp label="hi" />')
+
+        with self.settings(COTTON_INLINE_COMPONENTS=True):
+            loader = CottonLoader(engines["django"].engine, dirs=[templates_dir])
+            result = compile_templates(self.build_dir, loader)
+
+            origin = next(loader.get_template_sources("view.html"))
+            with open(os.path.join(self.build_dir, "view.html")) as f:
+                self.assertEquals(f.read(), loader.get_contents(origin))
+            self.assertEquals(
+                list(result.manifest["templates"]["view.html"]["dependencies"]),
+                ["cotton/comp.html"],
+            )
+
+            # The template is built again once the component it inlines changes
+            with open(component_path, "w") as f:
+                f.write("<i>{{ label }}</i>")
+            mtime = os.path.getmtime(component_path) + 1
+            os.utime(component_path, (mtime, mtime))
+
+            result = compile_templates(self.build_dir, loader)
+            self.assertEquals(result.compiled, ["view.html"])
+            with open(os.path.join(self.build_dir, "view.html")) as f:
+                self.assertIn("<i>", f.read())
+
+
+class TemplateWatcherTestCase(TestCase):
+    def setUp(self):
+        self.templates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.templates_dir, ignore_errors=True)
+        self.path = os.path.join(self.templates_dir, "view.html")
+        with open(self.path, "w") as f:
+            f.write("<c-comp />")
+
+    def start_watcher(self, kind):
+        watcher = get_template_watcher([self.templates_dir], kind, 0.01)
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def assertEventually(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Watcher didn't pick up the change")
+            time.sleep(0.01)
+
+    def assertWatcherTracksChanges(self, watcher):
+        self.assertEquals(watcher.get_mtime(self.path), os.path.getmtime(self.path))
+
+        os.utime(self.path, (1000, 1000))
+        self.assertEventually(lambda: watcher.get_mtime(self.path) == 1000)
+
+        new_path = os.path.join(self.templates_dir, "cotton", "new.html")
+        os.makedirs(os.path.dirname(new_path))
+        with open(new_path, "w") as f:
+            f.write("new")
+        self.assertEventually(lambda: watcher.get_mtime(new_path) is not None)
+
+        os.remove(self.path)
+        self.assertEventually(lambda: watcher.get_mtime(self.path) is None)
+
+    def test_polling_watcher_tracks_changes(self):
+        self.assertWatcherTracksChanges(self.start_watcher("polling"))
+
+    def test_inotify_watcher_tracks_changes(self):
+        if not InotifyWatcher.is_available():
+            self.skipTest("inotify is not available")
+
+        self.assertWatcherTracksChanges(self.start_watcher("inotify"))
+
+    def test_aliased_template_dirs_are_each_watched(self):
+        alias = os.path.join(tempfile.mkdtemp(), "alias")
+        self.addCleanup(shutil.rmtree, os.path.dirname(alias), ignore_errors=True)
+        os.symlink(self.templates_dir, alias)
+        alias_path = os.path.join(alias, "view.html")
+        kinds = ["polling", "inotify"] if InotifyWatcher.is_available() else ["polling"]
+
+        for mtime, kind in enumerate(kinds, start=1000):
+            with self.subTest(kind=kind):
+                watcher = get_template_watcher([self.templates_dir, alias], kind, 0.01)
+                self.addCleanup(watcher.stop)
+                self.assertEquals(watcher.get_mtime(alias_path), os.path.getmtime(self.path))
+
+                os.utime(self.path, (mtime, mtime))
+                self.assertEventually(lambda: watcher.get_mtime(self.path) == mtime)
+                self.assertEventually(lambda: watcher.get_mtime(alias_path) == mtime)
+
+    def test_watcher_kind_must_be_available(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_template_watcher([self.templates_dir], "fsevents", 0.01)
+
+        if not InotifyWatcher.is_available():
+            with self.assertRaises(ImproperlyConfigured):
+                get_template_watcher([self.templates_dir], "inotify", 0.01)
+
+    def test_loader_gets_mtimes_from_the_watcher(self):
+        with self.settings(COTTON_TEMPLATE_WATCHER="auto", COTTON_TEMPLATE_WATCHER_DELAY=0.01):
+            loader = CottonLoader(engines["django"].engine, dirs=[self.templates_dir])
+            self.addCleanup(lambda: loader.watcher.stop())
+
+            origin = next(loader.get_template_sources("view.html"))
+            self.assertIn("cotton_component", loader.get_contents(origin))
+
+            with open(self.path, "w") as f:
+                f.write("<c-changed />")
+            os.utime(self.path, (1000, 1000))
+            self.assertEventually(lambda: "changed" in loader.get_contents(origin))
+
+            origin = next(loader.get_template_sources("missing.html"))
+            with self.assertRaises(TemplateDoesNotExist):
+                loader.get_contents(origin)
@@ -0,0 +1,605 @@
+import re
+from collections import namedtuple
+from html import unescape
+
+from django.conf import settings
+
+# A django {% tag %} or {{ var }} found in the source, along with how it treats the whitespace either side of it.
+# left / right: whether whitespace on that side survives at all.
+# take_left / take_right: whether the token swallowed the neighbouring whitespace character, replacing it with a
+# single space.
+_Token = namedtuple("_Token", "text left right take_left take_right")
+
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class _Verbatim(str):
+    """Content of a {% cotton_verbatim %} block, which whitespace handling never reaches into."""
+
+
+class _Output:
+    """Collects compiled chunks, applying the whitespace rules of django syntax tokens as they are written."""
+
+    def __init__(self):
+        self.chunks = []
+        self.lstrip_next = False
+
+    def text(self, value):
+        if self.lstrip_next:
+            value = value.lstrip()
+            if not value:
+                return
+            self.lstrip_next = False
+
+        if value:
+            self.chunks.append(value)
+
+    def verbatim(self, value):
+        self.lstrip_next = False
+        self.chunks.append(_Verbatim(value))
+
+    def token(self, token):
+        if token.take_left:
+            self.text(" ")
+        elif not token.left:
+            self.rstrip()
+
+        self.text(token.text)
+
+        if token.take_right:
+            self.text(" ")
+        elif not token.right:
+            self.lstrip_next = True
+
+    def rstrip(self):
+        chunks = self.chunks
+        while chunks and not isinstance(chunks[-1], _Verbatim):
+            stripped = chunks[-1].rstrip()
+            if stripped:
+                chunks[-1] = stripped
+                return
+            chunks.pop()
+
+    def strip(self):
+        self.rstrip()
+        chunks = self.chunks
+        while chunks and not isinstance(chunks[0], _Verbatim):
+            stripped = chunks[0].lstrip()
+            if stripped:
+                chunks[0] = stripped
+                return
+            chunks.pop(0)
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
+class TokenizerCompiler:
+    """Compiles cotton syntax to django template syntax in a single pass over the source.
+
+    Rather than building an HTML document tree, the tokenizer only looks at what matters to cotton: <c-*> tags
+    (including <c-slot> and <c-vars>), {% %} and {{ }} tokens and {% cotton_verbatim %} blocks. Other markup is
+    only scanned for its boundaries and is copied to the output as written.
+
+    The output follows CottonCompiler, including its whitespace handling around django syntax and its collapsing of
+    whitespace-only text between tags. HTML is not re-serialised though, so entities, attribute quoting and order,
+    and valueless attributes are left exactly as they were written.
+
+    Enable with settings.COTTON_COMPILER = "tokenizer".
+    """
+
+    COTTON_VERBATIM_PATTERN = re.compile(
+        r"\{% cotton_verbatim %\}(.*?)\{% endcotton_verbatim %\}", re.DOTALL
+    )
+    DJANGO_TAG_PATTERN = re.compile(r"\{%.*?%\}")
+    DJANGO_VAR_PATTERN = re.compile(r"\{\{.*?\}\}")
+
+    def process(self, content, template_name):
+        return _Compilation(self, content, template_name).compile()
+
+
+class _Compilation:
+    """State of a single TokenizerCompiler.process() call."""
+
+    SCAN_PATTERN = re.compile(r"\{[%{]|<[a-zA-Z/!?]")
+    RAW_TEXT_END_PATTERNS = {
+        "script": re.compile(r"\{[%{]|</script\s*>", re.IGNORECASE),
+        "style": re.compile(r"\{[%{]|</style\s*>", re.IGNORECASE),
+    }
+    COMMENT_END_PATTERN = re.compile(r"\{[%{]|-->")
+    DECLARATION_END_PATTERN = re.compile(r"\{[%{]|>")
+    DOCTYPE_PATTERN = re.compile(r"<!doctype ([^>]*)>", re.IGNORECASE)
+    TAG_NAME_PATTERN = re.compile(r"[a-zA-Z](?:(?!\{[{%])[^\t\n\r\f />\x00])*")
+    CLOSING_TAG_PATTERN = re.compile(r"</([a-zA-Z][^\t\n\r\f />\x00]*)[^>]*>")
+    ATTRIBUTE_NAME_PATTERN = re.compile(r"(?:(?!\{[{%])[^\s/=>])+")
+    ATTRIBUTE_EQUALS_PATTERN = re.compile(r"\s*=+\s*")
+    VARS_CLOSING_TAG_PATTERN = re.compile(r"</c-vars\s*>", re.IGNORECASE)
+    WHITESPACE_PRESERVING_TAGS = ("pre", "textarea")
+
+    def __init__(self, compiler, source, template_name):
+        self.compiler = compiler
+        self.source = source
+        self.template_name = template_name
+        self.out = _Output()
+        self.text_start = 0
+        self.whitespace_before_vars = None
+        # Whether the text node currently being read contains django syntax
+        self.text_has_syntax = False
+        self.previous_token = None  # (is_tag, end) of the last {% %} or {{ }} token
+        self.open_tags = []  # [(tag name, closing syntax)]
+        self.preserve_whitespace_depth = 0
+        self.vars_frame = None
+
+    def compile(self):
+        source = self.source
+        pos = 0
+
+        while match := self.SCAN_PATTERN.search(source, pos):
+            start = match.start()
+
+            if source[start] == "{":
+                pos = self._handle_django_syntax(start)
+            elif source[start + 1] == "/":
+                pos = self._handle_closing_tag(start)
+            elif source[start + 1] in "!?":
+                pos = self._handle_declaration(start)
+            else:
+                pos = self._handle_opening_tag(start)
+
+        self._end_text(len(source))
+
+        while self.open_tags:
+            self.out.text(self.open_tags.pop()[1])
+
+        if self.vars_frame is None:
+            return self.out.getvalue()
+
+        self.out.strip()
+
+        return self.vars_frame + self.out.getvalue() + "{% endcotton_vars_frame %}"
+
+    def _flush_text(self, end):
+        if end > self.text_start:
+            self.out.text(self.source[self.text_start : end])
+            self.text_start = end
+
+    def _end_text(self, end):
+        """Flush the text node ending at 'end'. Whitespace-only text between tags collapses to a single newline or
+        space, as it does when parsed by bs4."""
+        text = self.source[self.text_start : end] if end > self.text_start else ""
+        self.text_start = max(self.text_start, end)
+        collapsed = None
+
+        if (
+            text
+            and not self.text_has_syntax
+            and not self.preserve_whitespace_depth
+            and not text.strip(ASCII_SPACES)
+        ):
+            if self.whitespace_before_vars is not None and not self.out.lstrip_next:
+                # Text either side of the removed <c-vars> is read again as one text node
+                text = self.whitespace_before_vars + text
+                self.out.chunks.pop()
+            collapsed = text = "\n" if "\n" in text else " "
+
+        self.out.text(text)
+        self.text_has_syntax = False
+        self.whitespace_before_vars = None
+
+        return collapsed
+
+    def _end_markup(self, end):
+        self._flush_text(end)
+        self.text_has_syntax = False
+
+    def _match_django_syntax(self, pos):
+        """Return (kind, end, content) for the django syntax starting at pos, kind being one of 'verbatim', 'tag' or
+        'var', or None when there is no complete token there."""
+        if match := self.compiler.COTTON_VERBATIM_PATTERN.match(self.source, pos):
+            return "verbatim", match.end(), match.group(1)
+
+        if match := self.compiler.DJANGO_TAG_PATTERN.match(self.source, pos):
+            return "tag", match.end(), match.group()
+
+        if match := self.compiler.DJANGO_VAR_PATTERN.match(self.source, pos):
+            return "var", match.end(), match.group()
+
+        return None, pos, None
+
+    def _is_tag_at(self, pos):
+        return self.source.startswith("{%", pos) and self._match_django_syntax(pos)[0] == "tag"
+
+    def _classify(self, start, end, is_tag):
+        """Work out how a {% %} or {{ }} token treats the whitespace around it. A single whitespace character either
+        side of it is kept (as a space), otherwise whitespace touching the token is stripped. Tags claim neighbouring
+        whitespace before variables do."""
+        source = self.source
+        previous = self.previous_token
+        left_space = start > 0 and source[start - 1].isspace()
+        right_space = end < len(source) and source[end].isspace()
+        claimed_by_tag = previous is not None and previous[0] and previous[1] == start - 1
+
+        if is_tag:
+            left = take_left = left_space and not claimed_by_tag
+            right = take_right = right_space
+        else:
+            claimed_by_var = previous is not None and not previous[0] and previous[1] == start - 1
+            follows_tag = previous is not None and previous[0] and previous[1] == start
+            left = follows_tag or (left_space and not claimed_by_var)
+            take_left = left_space and not claimed_by_var and not claimed_by_tag
+            right = right_space or self._is_tag_at(end)
+            take_right = right_space and not self._is_tag_at(end + 1)
+
+        self.previous_token = (is_tag, end)
+
+        return _Token(source[start:end], left, right, take_left, take_right)
+
+    def _handle_django_syntax(self, start):
+        kind, end, content = self._match_django_syntax(start)
+
+        if kind is None:
+            return start + 1
+
+        self.text_has_syntax = True
+
+        if kind == "verbatim":
+            self._flush_text(start)
+            self.out.verbatim(content)
+            self.text_start = end
+            return end
+
+        token = self._classify(start, end, kind == "tag")
+        self._flush_text(start - 1 if token.take_left else start)
+        self.out.token(token)
+        self.text_start = end + 1 if token.take_right else end
+
+        return self.text_start
+
+    def _handle_declaration(self, start):
+        """Comments, declarations and processing instructions are copied as they are."""
+        source = self.source
+        self._end_text(start)
+
+        if doctype := self.DOCTYPE_PATTERN.match(source, start):
+            # bs4 normalises the doctype and follows it with a new line
+            self.out.text(f"<!DOCTYPE {doctype.group(1)}>\n")
+            self.text_start = doctype.end()
+            return doctype.end()
+
+        if source.startswith("<!--", start):
+            end_pattern, pos = self.COMMENT_END_PATTERN, start + 4
+        else:
+            end_pattern, pos = self.DECLARATION_END_PATTERN, start + 2
+
+        return self._skip_raw_text(end_pattern, pos)
+
+    def _skip_raw_text(self, end_pattern, pos):
+        """Copy text through to end_pattern, only looking for django syntax on the way."""
+        while match := end_pattern.search(self.source, pos):
+            if self.source[match.start()] == "{":
+                pos = self._handle_django_syntax(match.start())
+            else:
+                self._end_markup(match.end())
+                return match.end()
+
+        return len(self.source)
+
+    def _handle_closing_tag(self, start):
+        match = self.CLOSING_TAG_PATTERN.match(self.source, start)
+        if not match:
+            return start + 1
+
+        self._end_text(start)
+        name = match.group(1).lower()
+
+        if not name.startswith("c-"):
+            if name in self.WHITESPACE_PRESERVING_TAGS and self.preserve_whitespace_depth:
+                self.preserve_whitespace_depth -= 1
+            self._end_markup(match.end())
+            return match.end()
+
+        self.text_start = match.end()
+
+        for index in range(len(self.open_tags) - 1, -1, -1):
+            if self.open_tags[index][0] == name:
+                while len(self.open_tags) > index:
+                    self.out.text(self.open_tags.pop()[1])
+                break
+
+        return match.end()
+
+    def _handle_opening_tag(self, start):
+        name_match = self.TAG_NAME_PATTERN.match(self.source, start + 1)
+        if not name_match:
+            return start + 1
+
+        name = name_match.group().lower()
+        attrs, self_closing, end, syntax = self._parse_tag(name_match.end())
+
+        if name == "c-vars" and self.vars_frame is None:
+            return self._remove_vars(start, end, self_closing, attrs, syntax)
+
+        self._end_text(start)
+
+        if not name.startswith("c-"):
+            for kind, syntax_start, syntax_end in syntax:
+                self._handle_django_syntax(syntax_start)
+            self._end_markup(end)
+
+            if name in self.RAW_TEXT_END_PATTERNS and not self_closing:
+                return self._skip_raw_text(self.RAW_TEXT_END_PATTERNS[name], end)
+            if name in self.WHITESPACE_PRESERVING_TAGS and not self_closing:
+                self.preserve_whitespace_depth += 1
+
+            return end
+
+        self.text_start = end
+        tokens = self._classify_all(syntax)
+
+        if name == "c-slot":
+            opening, closing = self._compile_named_slot(attrs, tokens)
+        else:
+            opening, closing = self._compile_component(name, attrs, tokens)
+
+        self.out.text(opening)
+
+        if self_closing:
+            self.out.text(closing)
+        else:
+            self.open_tags.append((name, closing))
+
+        return end
+
+    def _remove_vars(self, start, end, self_closing, attrs, syntax):
+        """The first <c-vars> becomes the vars frame wrapping the whole template."""
+        self.vars_frame = self._compile_vars_frame(attrs, self._classify_all(syntax))
+        self.whitespace_before_vars = self._end_text(start)
+
+        if not self_closing:
+            closing = self.VARS_CLOSING_TAG_PATTERN.search(self.source, end)
+            end = closing.end() if closing else len(self.source)
+
+        self.text_start = end
+
+        return end
+
+    def _parse_tag(self, pos):
+        """Parse the attributes of a tag, up to and including its closing '>'.
+
+        Returns (attrs, self_closing, end, syntax), where attrs is a list of (name, value) with value being the
+        (start, end) of the unquoted value in the source or None when valueless, and syntax is a list of
+        (kind, start, end) for the django syntax inside the tag.
+        """
+        source = self.source
+        length = len(source)
+        attrs = []
+        syntax = []
+
+        while True:
+            while pos < length and (
+                source[pos].isspace() or (source[pos] == "/" and not source.startswith("/>", pos))
+            ):
+                pos += 1
+
+            if pos >= length:
+                return attrs, False, length, syntax
+            if source[pos] == ">":
+                return attrs, source[pos - 1] == "/", pos + 1, syntax
+            if source.startswith("/>", pos):
+                return attrs, True, pos + 2, syntax
+
+            if source[pos] == "{":
+                kind, end, content = self._match_django_syntax(pos)
+                if kind is not None:
+                    # Django syntax in place of an attribute, i.e. <div {% if x %}class="y"{% endif %}>
+                    syntax.append((kind, pos, end))
+                    attrs.append(((kind, pos, end), None))
+                    pos = end
+                    continue
+
+            name_match = self.ATTRIBUTE_NAME_PATTERN.match(source, pos)
+            if not name_match:
+                pos += 1
+                continue
+
+            name = name_match.group().lower()
+            pos = name_match.end()
+
+            equals = self.ATTRIBUTE_EQUALS_PATTERN.match(source, pos)
+            if not equals:
+                attrs.append((name, None))
+                continue
+
+            pos = equals.end()
+            quote = source[pos] if pos < length and source[pos] in "\"'" else None
+            value_start = pos + 1 if quote else pos
+            value_end = self._find_value_end(value_start, quote, syntax)
+            attrs.append((name, (value_start, value_end)))
+            pos = value_end + 1 if quote and value_end < length else value_end
+
+    def _find_value_end(self, pos, quote, syntax):
+        source = self.source
+        length = len(source)
+
+        while pos < length:
+            char = source[pos]
+
+            if char == quote or (quote is None and (char == ">" or char.isspace())):
+                return pos
+
+            if char == "{":
+                kind, end, content = self._match_django_syntax(pos)
+                if kind is not None:
+                    syntax.append((kind, pos, end))
+                    pos = end
+                    continue
+
+            pos += 1
+
+        return length
+
+    def _classify_all(self, syntax):
+        return {
+            start: self._classify(start, end, kind == "tag")
+            for kind, start, end in syntax
+            if kind != "verbatim"
+        }
+
+    def _value_parts(self, value, tokens):
+        """Split an attribute value into unescaped text and django syntax tokens."""
+        start, end = value
+        source = self.source
+        parts = []
+        text_start = pos = start
+
+        while pos < end:
+            if source[pos] != "{":
+                pos = source.find("{", pos, end)
+                if pos == -1:
+                    break
+                continue
+
+            kind, syntax_end, content = self._match_django_syntax(pos)
+            if kind is None:
+                pos += 1
+                continue
+
+            if kind == "verbatim":
+                parts.append(unescape(source[text_start:pos]))
+                parts.append(_Verbatim(content))
+                pos = text_start = syntax_end
+                continue
+
+            token = tokens[pos]
+            if pos == start or syntax_end >= end:
+                # Unquoted values end at whitespace, so they never include the surrounding spaces
+                token = token._replace(
+                    take_left=token.take_left and pos > start,
+                    take_right=token.take_right and syntax_end < end,
+                )
+            parts.append(unescape(source[text_start : pos - 1 if token.take_left else pos]))
+            parts.append(token)
+            pos = text_start = syntax_end + 1 if token.take_right else syntax_end
+
+        parts.append(unescape(source[text_start:end]))
+
+        return [part for part in parts if part]
+
+    @staticmethod
+    def _render_value(parts):
+        out = _Output()
+        for part in parts:
+            if isinstance(part, _Token):
+                out.token(part)
+            elif isinstance(part, _Verbatim):
+                out.verbatim(part)
+            else:
+                out.text(part)
+
+        return out.getvalue()
+
+    @staticmethod
+    def _render_class_value(parts):
+        """An HTML parser treats class as a list, normalising the whitespace in the value."""
+        words = []
+        previous = None
+        for part in parts:
+            if isinstance(part, _Token):
+                joined = previous.right and part.left if isinstance(previous, _Token) else part.left
+                if words and joined:
+                    words.append(" ")
+                words.append(part.text)
+                previous = part
+                continue
+
+            for word in part.split():
+                if words and (not isinstance(previous, _Token) or previous.right):
+                    words.append(" ")
+                words.append(word)
+                previous = word
+
+        return "".join(words)
+
+    def _compile_vars_frame(self, attrs, tokens):
+        vars_with_defaults = []
+        for var, value in attrs:
+            if not isinstance(var, str):
+                var = self.source[var[1] : var[2]]
+
+            default = self._render_value(self._value_parts(value, tokens)) if value else ""
+            accessible_var = var.replace("-", "_")
+
+            if var.startswith(":"):
+                vars_with_defaults.append(
+                    f'{var[1:]}={accessible_var[1:]}|eval_default:"{default}"'
+                )
+            else:
+                vars_with_defaults.append(f'{var}={accessible_var}|default:"{default}"')
+
+        return "{% cotton_vars_frame " + " ".join(vars_with_defaults) + " %}"
+
+    def _compile_named_slot(self, attrs, tokens):
+        slot_name = ""
+        for name, value in attrs:
+            if name == "name" and value:
+                slot_name = self._render_value(self._value_parts(value, tokens)).strip()
+                break
+
+        component_key = self.template_name
+        for name, closing in reversed(self.open_tags):
+            if name != "c-slot":
+                component_key = name[2:]
+                break
+
+        return f"{{% cotton_slot {slot_name} {component_key} %}}", "{% end_cotton_slot %}"
+
+    def _compile_component(self, name, attrs, tokens):
+        component_key = name[2:]
+        component_path = component_key.replace(".", "/").replace("-", "_")
+        cotton_dir = getattr(settings, "COTTON_DIR", "cotton")
+
+        # c-only isolates the component from the context it's used in, rather than being one of its attributes
+        only = "only " if any(key == "c-only" for key, value in attrs) else ""
+        attrs = [(key, value) for key, value in attrs if key != "c-only"]
+
+        opening = _Output()
+        opening.text(
+            f"{{% cotton_component {only}{cotton_dir}/{component_path}.html {component_key} "
+        )
+
+        expression_attrs = []
+
+        for key, value in attrs:
+            if not isinstance(key, str):
+                # Django syntax in place of an attribute
+                opening.text(" ")
+                opening.token(tokens[key[1]]._replace(take_left=False, take_right=False))
+                continue
+
+            parts = self._value_parts(value, tokens) if value else []
+
+            if key == "class":
+                value = self._render_class_value(parts)
+                texts = [value]
+            else:
+                value = self._render_value(parts)
+                texts = [part for part in parts if type(part) is str]
+
+            # Django template tags cannot contain {{ }} or {% %}, nor new lines, so these are passed through a
+            # slot as "expression attrs" instead
+            has_syntax = any(type(part) is not str for part in parts)
+            if has_syntax or any("\n" in text or "=" in text for text in texts):
+                expression_attrs.append((key, value))
+            elif value:
+                opening.text(f' {key}="{value}"')
+            else:
+                opening.text(f" {key}")
+
+        opening.text(" %}")
+
+        for key, value in expression_attrs:
+            opening.text(
+                f"{{% cotton_slot {key} {component_key} expression_attr %}}{value}{{% end_cotton_slot %}}"
+            )
+
+        return opening.getvalue(), "{% end_cotton_component %}"
@@ -1,4 +1,7 @@
 import ast
+from itertools import islice
+
+from django.utils.safestring import SafeString
 
 
 def eval_string(value):
@@ -16,3 +19,30 @@ def ensure_quoted(value):
         return value
     else:
         return f'"{value}"'
+
+
+class Attrs(SafeString):
+    """A component's {{ attrs }}: the safe string of its html attributes, holding the attributes dict it's built from
+    as .attrs, for the merge filter. The first prefix_count attributes are already formatted as prefix, so only the
+    rest are formatted for each render."""
+
+    def __new__(cls, attrs, prefix="", prefix_count=0):
+        if prefix_count and prefix_count == len(attrs):
+            string = prefix
+        else:
+            attrs_strings = [
+                f"{key}={ensure_quoted(value)}"
+                for key, value in islice(attrs.items(), prefix_count, None)
+            ]
+            if prefix_count:
+                attrs_strings.insert(0, prefix)
+
+            string = " ".join(attrs_strings)
+
+        self = super().__new__(cls, string)
+        self.attrs = attrs
+
+        return self
+
+    def __reduce__(self):
+        return Attrs, (self.attrs,)
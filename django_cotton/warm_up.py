@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import get_commands
+from django.template import Engine, TemplateDoesNotExist
+from django.utils.autoreload import DJANGO_AUTORELOAD_ENV
+
+from django_cotton.cotton_loader import Loader, is_cotton_template
+from django_cotton.templatetags._component import get_component_template
+
+
+def warm_up(background=True, workers=None):
+    """Compile all cotton templates ahead of the first requests, filling the compiled template caches and the
+    component template cache. Runs in a daemon thread unless background is False, returning the thread, otherwise the
+    number of templates that were compiled. Enabled on startup with settings.COTTON_WARM_UP, for the processes that
+    serve requests, see is_server_process."""
+    if background:
+        thread = threading.Thread(
+            target=warm_up,
+            kwargs={"background": False, "workers": workers},
+            name="cotton-warm-up",
+            daemon=True,
+        )
+        thread.start()
+
+        return thread
+
+    engine = Engine.get_default()
+    loader = next(iter(get_cotton_loaders(engine)), None) or Loader(engine)
+    templates = {}
+
+    for template_name, path in loader.get_template_files():
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+
+        if loader.plain_templates.get(path) != mtime:
+            templates[loader.cache_handler.get_cache_key(template_name, mtime)] = (
+                template_name,
+                path,
+                mtime,
+            )
+
+    # Templates another process already compiled only need copying into our own cache
+    cached = loader.cache_handler.get_cached_templates(list(templates))
+    to_compile = [template for cache_key, template in templates.items() if cache_key not in cached]
+
+    def compile_template(template):
+        template_name, path, mtime = template
+        template_string = loader._get_template_string(path)
+
+        if not is_cotton_template(template_string):
+            loader.plain_templates[path] = mtime
+            return None
+
+        return loader.compile(template_string, template_name)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(compile_template, to_compile)
+
+        compiled = {
+            loader.cache_handler.get_cache_key(template_name, mtime): compiled_template
+            for (template_name, path, mtime), compiled_template in zip(to_compile, results)
+            if compiled_template is not None
+        }
+
+    loader.cache_handler.cache_templates(compiled)
+
+    warm_up_components(loader)
+
+    return len(compiled)
+
+
+def is_server_process(argv=None):
+    """Whether the process serves requests, so is worth warming up: it isn't running a management command other than
+    runserver, nor is it runserver's autoreloader, which only restarts the server in a child process when files change.
+    Processes started by a WSGI or ASGI server, i.e. gunicorn or uvicorn, are."""
+    argv = sys.argv if argv is None else argv
+
+    if len(argv) < 2 or argv[1] not in get_commands():
+        return True
+
+    if argv[1] != "runserver":
+        return False
+
+    return os.environ.get(DJANGO_AUTORELOAD_ENV) == "true" or "--noreload" in argv
+
+
+def warm_up_components(loader):
+    """Fill the cache that component templates are rendered from."""
+    component_prefix = getattr(settings, "COTTON_DIR", "cotton") + "/"
+
+    for template_name, path in loader.get_template_files():
+        if template_name.startswith(component_prefix):
+            try:
+                get_component_template(template_name, loader.engine)
+            except TemplateDoesNotExist:
+                pass
+
+
+def get_cotton_loaders(engine):
+    """The engine's cotton loaders, including those wrapped by the cached loader."""
+    for loader in engine.template_loaders:
+        for inner_loader in getattr(loader, "loaders", [loader]):
+            if isinstance(inner_loader, Loader):
+                yield inner_loader